@@ -0,0 +1,545 @@
+"""Offline end-to-end benchmark driving MemeBot against local stand-in services
+
+    python benchmark.py --rate 2000 --duration 60
+    python benchmark.py --trades recorded.jsonl --openai-error-rate 0.1 --json report.json
+
+A local WebSocket server replays synthetic or recorded subscribeTokenTrade streams,
+an aiohttp app serves DexScreener pairs and generated images, and OpenAI/Twitter are
+replaced with in-process stand-ins with configurable latency and error injection.
+Nothing leaves the machine and no API keys are needed.
+"""
+import os
+import io
+import sys
+import time
+import json
+import math
+import types
+import random
+import shutil
+import asyncio
+import argparse
+import resource
+import tempfile
+import contextlib
+import contextvars
+import numpy as np
+import requests
+import websockets
+from aiohttp import web
+from PIL import Image
+import tweepy
+
+# The bot reads these at construction time, keep everything local to the run
+for key in ("OPENAI_API_KEY", "TWITTER_API_KEY", "TWITTER_API_SECRET",
+            "TWITTER_ACCESS_TOKEN", "TWITTER_ACCESS_TOKEN_SECRET"):
+    os.environ.setdefault(key, "benchmark")
+for key in ("SERIES_PATH", "STATE_PATH", "METRICS_PORT"):
+    os.environ.pop(key, None)
+
+import bot
+
+WORDS = (
+    "ser wagmi pump moon rug cope hopium chart candle green red degen ape fren gm gn based "
+    "bags diamond hands paper jeet send it vibes alpha whale dip rip ath floor ngmi lfg "
+    "cooked cookin fine chill rekt bullish bearish liquidity mcap sol impuls ticker frens"
+).split()
+
+def rss_mb():
+    """Current resident set size, falling back to the peak where /proc is missing"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+class Injector:
+    """Latency and error injection shared by the API stand-ins"""
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.calls = 0
+        self.errors = 0
+
+    def delay(self):
+        return max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+
+    def fail(self):
+        self.calls += 1
+        if self.random.random() < self.error_rate:
+            self.errors += 1
+            return True
+        return False
+
+class FakeOpenAI:
+    """AsyncOpenAI stand-in answering chat and image requests locally"""
+    def __init__(self, image_base, text=None, image=None):
+        self.image_base = image_base
+        self.text = text or Injector()
+        self.image = image or Injector()
+        self.chat = types.SimpleNamespace(completions=types.SimpleNamespace(create=self.create_chat))
+        self.images = types.SimpleNamespace(generate=self.generate_image)
+
+    async def create_chat(self, n=1, **kwargs):
+        await asyncio.sleep(self.text.delay())
+        if self.text.fail():
+            raise ConnectionError("injected OpenAI chat failure")
+        # Random word salads keep candidates distinct enough for the tweet pool
+        choices = [
+            types.SimpleNamespace(message=types.SimpleNamespace(
+                content=" ".join(self.text.random.choice(WORDS) for _ in range(14))
+            ))
+            for _ in range(n)
+        ]
+        return types.SimpleNamespace(choices=choices)
+
+    async def generate_image(self, **kwargs):
+        await asyncio.sleep(self.image.delay())
+        if self.image.fail():
+            raise ConnectionError("injected OpenAI image failure")
+        url = f"{self.image_base}/image/{self.image.calls}.png"
+        return types.SimpleNamespace(data=[types.SimpleNamespace(url=url)])
+
+class FakeTwitter:
+    """tweepy API/Client stand-in, called from worker threads like the real ones"""
+    def __init__(self, upload=None, post=None, on_post=None):
+        self.upload = upload or Injector()
+        self.post = post or Injector()
+        self.on_post = on_post  # called with the tweet text once it is "live"
+        self.media = 0
+        self.tweets = []
+
+    @staticmethod
+    def server_error():
+        response = requests.Response()
+        response.status_code = 503
+        response.reason = "Service Unavailable"
+        response._content = b'{"errors": [{"message": "injected Twitter failure"}]}'
+        return tweepy.TwitterServerError(response)
+
+    def media_upload(self, filename=None, file=None, **kwargs):
+        time.sleep(self.upload.delay())
+        if self.upload.fail():
+            raise self.server_error()
+        file.read()
+        self.media += 1
+        return types.SimpleNamespace(media_id=self.media)
+
+    def create_tweet(self, text=None, media_ids=None, **kwargs):
+        time.sleep(self.post.delay())
+        if self.post.fail():
+            raise self.server_error()
+        self.tweets.append(text)
+        if self.on_post:
+            self.on_post(text)
+        return types.SimpleNamespace(data={'id': str(len(self.tweets))})
+
+class TradeStream:
+    """Synthetic PumpFun trades that walk the market cap up to migration"""
+    def __init__(self, mint, start_cap=30.0, migrate_after=60.0, large_trade_rate=0.001, seed=None):
+        self.mint = mint
+        self.cap = start_cap
+        self.start_cap = start_cap
+        self.migrate_after = migrate_after    # seconds until the drift reaches the migration cap
+        self.large_trade_rate = large_trade_rate
+        self.random = random.Random(seed)
+
+    def messages(self, count, elapsed):
+        """`count` encoded trade messages at `elapsed` seconds into the run"""
+        cap = bot.PumpFunTracker.migration_cap
+        if self.migrate_after > 0:
+            drift = self.start_cap * (cap * 1.05 / self.start_cap) ** min(1.0, elapsed / self.migrate_after)
+        else:
+            drift = self.start_cap
+        messages = []
+        for _ in range(count):
+            # Mean-reverting noise around the drift gives the mood engine something to react to
+            self.cap += (drift - self.cap) * 0.05 + self.cap * self.random.gauss(0, 0.01)
+            large = self.random.random() < self.large_trade_rate
+            sol = self.random.uniform(5, 20) if large else self.random.expovariate(3)
+            messages.append(json.dumps({
+                'signature': f"{self.random.getrandbits(64):x}",
+                'mint': self.mint,
+                'txType': self.random.choice(("buy", "sell")),
+                'solAmount': round(sol, 6),
+                'marketCapSol': round(self.cap, 6),
+            }))
+        return messages
+
+class FakePumpPortal:
+    """WebSocket server streaming trades to subscribers at a fixed rate (0 = flat out)"""
+    def __init__(self, stream=None, recorded=None, rate=1000, loop_recorded=True):
+        self.stream = stream
+        self.recorded = recorded or []        # pre-encoded messages replayed in order
+        self.rate = rate
+        self.loop_recorded = loop_recorded
+        self.sent = 0
+        self.subscribed = set()
+        self.active = 0.0                     # seconds spent streaming to a subscriber
+        self.started = None
+        self.server = None
+
+    async def handler(self, websocket):
+        sender = None
+        try:
+            async for raw in websocket:
+                message = json.loads(raw)
+                if message.get('method') == 'subscribeTokenTrade':
+                    self.subscribed.update(message.get('keys', []))
+                    if sender is None or sender.done():
+                        sender = asyncio.create_task(self.send(websocket))
+                elif message.get('method') == 'unsubscribeTokenTrade':
+                    # Like PumpPortal, stop streaming once nobody listens
+                    self.subscribed.difference_update(message.get('keys', []))
+                    if not self.subscribed and sender:
+                        sender.cancel()
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            if sender:
+                sender.cancel()
+
+    def batch(self, count, elapsed):
+        if not self.recorded:
+            return self.stream.messages(count, elapsed)
+        messages = []
+        for _ in range(count):
+            if self.sent + len(messages) >= len(self.recorded) and not self.loop_recorded:
+                break
+            messages.append(self.recorded[(self.sent + len(messages)) % len(self.recorded)])
+        return messages
+
+    async def send(self, websocket):
+        self.started = self.started or time.perf_counter()
+        resumed = time.perf_counter()
+        try:
+            while True:
+                elapsed = time.perf_counter() - self.started
+                if self.rate:
+                    due = int((self.active + time.perf_counter() - resumed) * self.rate) - self.sent
+                else:
+                    due = 500
+                messages = self.batch(max(0, due), elapsed)
+                if due and not messages:
+                    return  # Recording exhausted
+                for message in messages:
+                    await websocket.send(message)
+                self.sent += len(messages)
+                await asyncio.sleep(0.005 if self.rate else 0)
+        finally:
+            self.active += time.perf_counter() - resumed
+
+    async def start(self, host="127.0.0.1"):
+        self.server = await websockets.serve(self.handler, host, 0)
+        port = self.server.sockets[0].getsockname()[1]
+        return f"ws://{host}:{port}"
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+class FakeHttp:
+    """DexScreener token endpoint plus the image URLs handed out by FakeOpenAI"""
+    def __init__(self, latency=0.0, period=30.0, amplitude=120.0, image_size=512, seed=None):
+        self.latency = latency
+        self.period = period                  # seconds per full swing of the h1 change
+        self.amplitude = amplitude            # peak h1 change in percent
+        self.random = random.Random(seed)
+        self.started = time.time()
+        self.requests = 0
+        self.images = 0
+        self.runner = None
+        pixels = np.random.default_rng(seed).integers(0, 256, (image_size, image_size, 3), dtype=np.uint8)
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).save(buffer, format="PNG")
+        self.png = buffer.getvalue()
+
+    def pair(self, token, now):
+        # Each token swings through every mood with its own phase
+        phase = (hash(token) % 1000) / 1000 * 2 * math.pi
+        change = self.amplitude * math.sin(2 * math.pi * (now - self.started) / self.period + phase)
+        change += self.random.gauss(0, 2)
+        return {
+            'baseToken': {'address': token},
+            'priceUsd': f"{0.001 * (1 + change / 200):.8f}",
+            'priceChange': {'h1': round(change, 2)},
+            'volume': {'h1': round(self.random.uniform(1e3, 1e5), 2)},
+        }
+
+    async def tokens(self, request):
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        now = time.time()
+        pairs = [self.pair(token, now) for token in request.match_info['tokens'].split(",") if token]
+        return web.json_response({'schemaVersion': "1.0.0", 'pairs': pairs})
+
+    async def image(self, request):
+        self.images += 1
+        return web.Response(body=self.png, content_type="image/png")
+
+    async def start(self, host="127.0.0.1"):
+        app = web.Application()
+        app.router.add_get("/latest/dex/tokens/{tokens}", self.tokens)
+        app.router.add_get("/image/{name}", self.image)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+class Benchmark:
+    """Run one MemeBot against the fakes and collect throughput, latency and memory numbers"""
+    def __init__(self, args):
+        self.args = args
+        self.trigger = contextvars.ContextVar("trigger", default=None)
+        self.triggers = {}        # tweet text -> time of the trade or sample behind it
+        self.post_latency = []    # trigger -> tweet live
+        self.event_latency = []   # trigger -> event handled (includes local Phase 1 posts)
+        self.memory = []
+
+    def trigger_time(self, event):
+        """Arrival time of the last observation that could have produced `event`"""
+        if event['token'] == self.bot.phase2_token:
+            cached = self.bot.phase2_tracker.client.cache.get(event['token'])
+            return cached[0] if cached else event['time']
+        timestamps = self.bot.phase1_tracker.buffer.ordered()[0]
+        index = np.searchsorted(timestamps, event['time'], side='right') - 1
+        return float(timestamps[index]) if index >= 0 else event['time']
+
+    def instrument(self):
+        """Tag every post with the time of the trade or sample that triggered it"""
+        handle_event = self.bot.handle_event
+        enqueue = self.bot.outbox.enqueue
+
+        async def timed_event(event):
+            trigger = self.trigger_time(event)
+            self.trigger.set(trigger)
+            await handle_event(event)
+            self.event_latency.append(time.time() - trigger)
+
+        def tagged_enqueue(token, mood, text, image):
+            if self.trigger.get() is not None:
+                self.triggers[text] = self.trigger.get()
+            return enqueue(token, mood, text, image)
+
+        def posted(text):
+            trigger = self.triggers.pop(text, None)
+            if trigger is not None:
+                self.post_latency.append(time.time() - trigger)
+
+        self.bot.handle_event = timed_event
+        self.bot.outbox.enqueue = tagged_enqueue
+        self.twitter.on_post = posted
+
+    def configure(self):
+        args = self.args
+        os.environ["TWEETS_PER_DAY"] = str(args.tweets_per_day)
+        os.environ["HEARTBEAT_INTERVAL"] = str(args.heartbeat)
+        os.environ["MOOD_MIN_DWELL"] = str(args.min_dwell)
+        os.environ["PHASE_OVERLAP"] = str(args.overlap)
+        os.environ["LARGE_TRADE_SOL"] = str(args.large_trade_sol)
+
+    def recorded(self):
+        """Encoded messages from a JSONL capture and the most traded mint in it"""
+        messages, mints = [], {}
+        with open(self.args.trades) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                mint = json.loads(line).get('mint')
+                if mint:
+                    mints[mint] = mints.get(mint, 0) + 1
+                    messages.append(line)
+        return messages, max(mints, key=mints.get) if mints else None
+
+    async def sample_memory(self):
+        while True:
+            self.memory.append(rss_mb())
+            await asyncio.sleep(0.5)
+
+    async def run(self):
+        args = self.args
+        self.configure()
+        phase1, phase2 = args.phase1, args.phase2
+        recorded = None
+        if args.trades:
+            recorded, mint = self.recorded()
+            phase1 = mint or phase1
+
+        portal = FakePumpPortal(
+            stream=TradeStream(phase1, migrate_after=args.migrate_after, seed=args.seed),
+            recorded=recorded,
+            rate=args.rate,
+        )
+        http = FakeHttp(latency=args.dex_latency, period=args.swing_period, seed=args.seed)
+        bot.PumpPortalConnection.uri = await portal.start()
+        base = await http.start()
+        bot.DexScreenerClient.base_url = base + "/latest/dex/tokens/"
+        bot.DexScreenerClient.shared().cache_ttl = args.heartbeat
+
+        data_dir = tempfile.mkdtemp(prefix="impuls-bench-")
+        self.bot = bot.MemeBot(phase1_token=phase1, phase2_token=phase2, data_dir=data_dir)
+        self.bot.async_client = FakeOpenAI(
+            base,
+            text=Injector(args.text_latency, args.text_latency / 2, args.openai_error_rate, args.seed),
+            image=Injector(args.image_latency, args.image_latency / 2, args.openai_error_rate, args.seed),
+        )
+        self.twitter = FakeTwitter(
+            upload=Injector(args.upload_latency, args.upload_latency / 2, args.twitter_error_rate, args.seed),
+            post=Injector(args.post_latency, args.post_latency / 2, args.twitter_error_rate, args.seed),
+        )
+        self.bot.twitter_api = self.twitter
+        self.bot.twitter_client = self.twitter
+        self.instrument()
+
+        counters = bot.metrics.counters
+        trades_before = counters[("trades_total", ())]
+        memory_before = rss_mb()
+        sampler = asyncio.create_task(self.sample_memory())
+        started = time.perf_counter()
+        runner = asyncio.create_task(self.bot.run_events())
+        try:
+            await asyncio.sleep(args.duration)
+        finally:
+            runner.cancel()
+            await asyncio.gather(runner, return_exceptions=True)
+            elapsed = time.perf_counter() - started
+            trades = counters[("trades_total", ())] - trades_before
+            sent, streaming = portal.sent, portal.active or elapsed
+            # Let posts already generated go out before tearing down
+            await self.bot.outbox.drain(timeout=args.drain)
+            await self.bot.outbox.stop()
+            await self.bot.image_pool.wait()
+            await self.bot.tweet_pool.wait()
+            await self.bot.close()
+            sampler.cancel()
+            await portal.stop()
+            await http.stop()
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+        return self.report(elapsed, streaming, sent, trades, memory_before)
+
+    @staticmethod
+    def percentiles(samples):
+        if not samples:
+            return {'count': 0, 'p50': None, 'p99': None, 'max': None}
+        values = np.asarray(samples)
+        return {
+            'count': len(values),
+            'p50': float(np.percentile(values, 50)),
+            'p99': float(np.percentile(values, 99)),
+            'max': float(values.max()),
+        }
+
+    def report(self, elapsed, streaming, sent, trades, memory_before):
+        api_calls = {dict(labels)['api']: value for (name, labels), value in bot.metrics.counters.items()
+                     if name == "api_calls_total"}
+        posts = len(self.twitter.tweets)
+        stages = {}
+        for (name, labels), (counts, total, count) in bot.metrics.histograms.items():
+            if count:
+                stages[dict(labels)['stage']] = {'count': count, 'mean': total / count}
+        return {
+            'duration': elapsed,
+            'streaming': streaming,
+            'trades_sent': sent,
+            'trades_ingested': trades,
+            'trades_per_sec': trades / streaming if streaming else 0.0,
+            'trades_dropped': self.bot.phase1_tracker.connection.dropped,
+            'posts': posts,
+            'post_latency': self.percentiles(self.post_latency),
+            'event_latency': self.percentiles(self.event_latency),
+            'memory_mb': {
+                'start': memory_before,
+                'end': self.memory[-1] if self.memory else rss_mb(),
+                'peak': max(self.memory, default=memory_before),
+                'growth': (self.memory[-1] if self.memory else rss_mb()) - memory_before,
+            },
+            'api_calls': api_calls,
+            'api_calls_per_post': sum(api_calls.values()) / posts if posts else None,
+            'injected_errors': {
+                'openai': self.bot.async_client.text.errors + self.bot.async_client.image.errors,
+                'twitter': self.twitter.upload.errors + self.twitter.post.errors,
+            },
+            'phase': self.bot.phase,
+            'stages': stages,
+        }
+
+def print_report(report):
+    def ms(value):
+        return "-" if value is None else f"{value * 1000:.1f} ms"
+
+    print("\n=== Benchmark ===")
+    print(f"Duration:         {report['duration']:.1f}s (ended in Phase {report['phase']})")
+    print(f"Trades:           {report['trades_ingested']:.0f} ingested of {report['trades_sent']} sent, "
+          f"{report['trades_dropped']} dropped")
+    print(f"Throughput:       {report['trades_per_sec']:.0f} trades/sec over {report['streaming']:.1f}s of streaming")
+    for label, key in (("Trade to post:", 'post_latency'), ("Trade to event:", 'event_latency')):
+        latency = report[key]
+        print(f"{label:<17} n={latency['count']} p50={ms(latency['p50'])} "
+              f"p99={ms(latency['p99'])} max={ms(latency['max'])}")
+    memory = report['memory_mb']
+    print(f"Memory:           {memory['start']:.1f} -> {memory['end']:.1f} MB "
+          f"(peak {memory['peak']:.1f}, growth {memory['growth']:+.1f})")
+    per_post = report['api_calls_per_post']
+    print(f"Posts:            {report['posts']}, "
+          f"{'-' if per_post is None else f'{per_post:.2f}'} API calls per post")
+    print("API calls:        " + ", ".join(f"{api}={count:.0f}" for api, count in sorted(report['api_calls'].items())))
+    print(f"Injected errors:  OpenAI {report['injected_errors']['openai']}, "
+          f"Twitter {report['injected_errors']['twitter']}")
+    print("Stage means:      " + ", ".join(
+        f"{stage}={ms(stats['mean'])}" for stage, stats in sorted(report['stages'].items())))
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--duration", type=float, default=30, help="seconds to run the bot")
+    parser.add_argument("--rate", type=float, default=1000, help="trades/sec to stream, 0 streams flat out")
+    parser.add_argument("--trades", help="JSONL of recorded PumpPortal trade messages to replay")
+    parser.add_argument("--phase1", default="BENCH1pump", help="Phase 1 mint for synthetic streams")
+    parser.add_argument("--phase2", default="BENCH2pump", help="Phase 2 token served by the DexScreener fake")
+    parser.add_argument("--migrate-after", type=float, default=10, help="seconds until synthetic trades hit the migration cap, 0 never")
+    parser.add_argument("--swing-period", type=float, default=20, help="seconds per full DexScreener mood swing")
+    parser.add_argument("--text-latency", type=float, default=0.8)
+    parser.add_argument("--image-latency", type=float, default=3.0)
+    parser.add_argument("--upload-latency", type=float, default=0.3)
+    parser.add_argument("--post-latency", type=float, default=0.2)
+    parser.add_argument("--dex-latency", type=float, default=0.05)
+    parser.add_argument("--openai-error-rate", type=float, default=0.0)
+    parser.add_argument("--twitter-error-rate", type=float, default=0.0)
+    parser.add_argument("--tweets-per-day", type=float, default=100000, help="posting budget, high by default to measure the pipeline")
+    parser.add_argument("--heartbeat", type=float, default=1, help="DexScreener sampling interval")
+    parser.add_argument("--min-dwell", type=float, default=2)
+    parser.add_argument("--overlap", type=float, default=5, help="seconds Phase 1 keeps streaming after migration")
+    parser.add_argument("--large-trade-sol", type=float, default=5)
+    parser.add_argument("--drain", type=float, default=30, help="seconds to wait for queued posts at the end")
+    parser.add_argument("--seed", type=int, default=420)
+    parser.add_argument("--json", help="also write the report to this file")
+    parser.add_argument("--verbose", action="store_true", help="show the bot's own log output")
+    parser.add_argument("--max-p99", type=float, help="exit non-zero when trade-to-post p99 exceeds this many seconds")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    with contextlib.ExitStack() as stack:
+        if not args.verbose:
+            stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, "w"))))
+        report = asyncio.run(Benchmark(args).run())
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    p99 = report['post_latency']['p99']
+    if args.max_p99 is not None and (p99 is None or p99 > args.max_p99):
+        print(f"\nTrade-to-post p99 above {args.max_p99}s")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
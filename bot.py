@@ -1,15 +1,267 @@
 import os
 import time
-import requests
 import asyncio
 import websockets
+import aiohttp
 import json
-from openai import OpenAI
+import contextlib
+import re
+import io
+import hashlib
+import sqlite3
+import heapq
+import random
+import bisect
+import queue
+import resource
+import multiprocessing
+import concurrent.futures
+import numpy as np
+from openai import OpenAI, AsyncOpenAI
 from dotenv import load_dotenv
-from collections import deque
+from collections import deque, defaultdict
 from datetime import datetime
+from PIL import Image
 import tweepy
 
+# Optional faster JSON decoder for the trade stream
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+class Metrics:
+    """Process-wide counters, gauges and latency histograms in Prometheus text format"""
+    buckets = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+    
+    def __init__(self, prefix="impuls"):
+        self.prefix = prefix
+        self.counters = defaultdict(float)    # (name, labels) -> value
+        self.gauges = {}                      # (name, labels) -> callable returning the value
+        self.histograms = {}                  # (name, labels) -> [bucket counts, sum, count]
+        
+    @staticmethod
+    def key(name, labels):
+        return name, tuple(sorted(labels.items()))
+        
+    def inc(self, name, value=1, **labels):
+        self.counters[self.key(name, labels)] += value
+        
+    def gauge(self, name, read, **labels):
+        """Register `read` to be sampled whenever metrics are rendered"""
+        self.gauges[self.key(name, labels)] = read
+        
+    def observe(self, stage, seconds):
+        """Record one latency sample for `stage`"""
+        key = self.key("stage_seconds", {'stage': stage})
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        histogram[0][bisect.bisect_left(self.buckets, seconds)] += 1
+        histogram[1] += seconds
+        histogram[2] += 1
+        
+    @contextlib.contextmanager
+    def timer(self, stage):
+        """Time the enclosed block, including any awaits inside it"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+            
+    def labels(self, labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+        
+    def render(self):
+        """Prometheus exposition text, one TYPE line per metric family"""
+        lines = []
+        typed = set()
+        
+        def family(name, kind):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+                
+        for kind, items in (('counter', self.counters.items()), ('gauge', self.gauges.items())):
+            for (name, labels), value in sorted(items, key=lambda item: item[0]):
+                if kind == 'gauge':
+                    try:
+                        value = value()
+                    except Exception:
+                        continue
+                family(f"{self.prefix}_{name}", kind)
+                lines.append(f"{self.prefix}_{name}{self.labels(labels)} {value}")
+        for (name, labels), (counts, total, count) in sorted(self.histograms.items()):
+            full = f"{self.prefix}_{name}"
+            family(full, "histogram")
+            cumulative = 0
+            for bound, bucket in zip(list(self.buckets) + ["+Inf"], counts):
+                cumulative += bucket
+                lines.append(f"{full}_bucket{self.labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{full}_sum{self.labels(labels)} {total}")
+            lines.append(f"{full}_count{self.labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+        
+    async def handle_request(self, reader, writer):
+        try:
+            await reader.readuntil(b"\r\n\r\n")
+            body = self.render().encode()
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                + f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except Exception:
+            pass
+        finally:
+            writer.close()
+            
+    async def serve(self, host="127.0.0.1", port=9100):
+        """Expose /metrics over HTTP on the running event loop"""
+        server = await asyncio.start_server(self.handle_request, host, port)
+        log(f"Metrics available at http://{host}:{port}/metrics")
+        return server
+
+metrics = Metrics()
+LOG_JSON = os.getenv("LOG_FORMAT", "text").lower() == "json"
+
+def log(message, level="info", **fields):
+    """Print `message`, or one JSON object per line when LOG_FORMAT=json"""
+    if level == "error":
+        metrics.inc("errors_total")
+    if LOG_JSON:
+        print(json.dumps({'ts': time.time(), 'level': level, 'msg': message.strip(), **fields}, default=str), flush=True)
+    else:
+        print(message)
+
+class StateStore:
+    """SQLite key/value store for state that must survive one-shot runs"""
+    def __init__(self, path="bot_state.db"):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL, updated REAL NOT NULL)"
+        )
+        
+    def get(self, key, default=None):
+        row = self.conn.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+        
+    def set(self, key, value):
+        self.update({key: value})
+        
+    def update(self, values):
+        """Write several keys in one transaction"""
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO state (key, value, updated) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated = excluded.updated",
+                [(key, json.dumps(value), now) for key, value in values.items()]
+            )
+            
+    def close(self):
+        self.conn.close()
+
+class SeriesStore:
+    """Append-only columnar time series per token, memory-mapped for reads"""
+    columns = ('timestamp', 'value', 'volume')
+    dtype = np.dtype('<f8')
+    
+    def __init__(self, directory="series"):
+        self.directory = directory
+        self.files = {}     # key -> {column: append handle}
+        self.maps = {}      # key -> (length, {column: memmap})
+        self.last = {}      # key -> last timestamp written
+        
+    def path(self, key, column):
+        return os.path.join(self.directory, key, f"{column}.f8")
+        
+    def open(self, key):
+        """Append handles for `key`, trimming any torn row left by a crash"""
+        if key not in self.files:
+            os.makedirs(os.path.join(self.directory, key), exist_ok=True)
+            sizes = [os.path.getsize(self.path(key, c)) if os.path.exists(self.path(key, c)) else 0
+                     for c in self.columns]
+            rows = min(sizes) // self.dtype.itemsize
+            handles = {}
+            for column in self.columns:
+                handle = open(self.path(key, column), "ab")
+                handle.truncate(rows * self.dtype.itemsize)
+                handles[column] = handle
+            self.files[key] = handles
+            if rows:
+                self.last[key] = float(self.read(key)[0][-1])
+        return self.files[key]
+        
+    def append(self, key, timestamp, value, volume=0.0):
+        """Append one observation, keeping timestamps non-decreasing"""
+        handles = self.open(key)
+        timestamp = max(timestamp, self.last.get(key, timestamp))
+        self.last[key] = timestamp
+        for column, x in zip(self.columns, (timestamp, value, volume)):
+            handles[column].write(self.dtype.type(x).tobytes())
+            
+    def flush(self, key=None):
+        for k in ([key] if key else list(self.files)):
+            for handle in self.files.get(k, {}).values():
+                handle.flush()
+                
+    def close(self):
+        self.flush()
+        for handles in self.files.values():
+            for handle in handles.values():
+                handle.close()
+        self.files = {}
+        self.maps = {}
+        
+    def read(self, key):
+        """(timestamps, values, volumes) as read-only memory maps"""
+        self.flush(key)
+        sizes = [os.path.getsize(self.path(key, c)) if os.path.exists(self.path(key, c)) else 0
+                 for c in self.columns]
+        rows = min(sizes) // self.dtype.itemsize
+        if rows == 0:
+            empty = np.zeros(0, dtype=self.dtype)
+            return empty, empty, empty
+            
+        # Remap only when the log has grown since the last read
+        cached = self.maps.get(key)
+        if cached is None or cached[0] != rows:
+            maps = {c: np.memmap(self.path(key, c), dtype=self.dtype, mode='r', shape=(rows,))
+                    for c in self.columns}
+            self.maps[key] = cached = (rows, maps)
+        return tuple(cached[1][c] for c in self.columns)
+        
+    def range(self, key, start, end=None):
+        """Observations with start <= timestamp < end via binary search"""
+        timestamps, values, volumes = self.read(key)
+        lo = np.searchsorted(timestamps, start, side='left')
+        hi = len(timestamps) if end is None else np.searchsorted(timestamps, end, side='left')
+        return timestamps[lo:hi], values[lo:hi], volumes[lo:hi]
+        
+    def since(self, key, start):
+        """Return (change %, observation count, volume) from `start` to the latest value"""
+        timestamps, values, volumes = self.read(key)
+        if len(timestamps) == 0:
+            return 0.0, 0, 0.0
+        i = np.searchsorted(timestamps, start, side='left')
+        
+        # Compare against the value in effect at `start`
+        reference = values[i - 1] if i > 0 else values[0]
+        change = ((values[-1] - reference) / reference) * 100 if reference else 0.0
+        return float(change), int(len(timestamps) - i), float(volumes[i:].sum())
+        
+    def window(self, key, seconds, now=None):
+        """Return (change %, observation count, volume) over the last `seconds`"""
+        now = time.time() if now is None else now
+        return self.since(key, now - seconds)
+
 class PriceTracker:
     """Base class for price tracking"""
     def __init__(self, token, check_interval):
@@ -18,131 +270,1971 @@ class PriceTracker:
         self.last_price = None
         self.last_check_time = None
         
+    @property
+    def state_key(self):
+        return f"tracker:{type(self).__name__}:{self.token}"
+        
+    def snapshot(self):
+        """Observations worth persisting between runs"""
+        return {'last_price': self.last_price, 'last_check_time': self.last_check_time}
+        
+    def restore(self, state):
+        """Reload observations saved by `snapshot`"""
+        self.last_price = state.get('last_price')
+        self.last_check_time = state.get('last_check_time')
+        
     async def get_price(self):
         """Must be implemented by child classes"""
         raise NotImplementedError
 
-class PumpFunTracker(PriceTracker):
-    """Phase 1: PumpFun price tracking via WebSocket"""
-    def __init__(self, token):
-        super().__init__(token, check_interval=300)  # 5 minutes
+class TradeBuffer:
+    """Fixed-size ring buffer of recent trades backed by numpy arrays"""
+    def __init__(self, capacity=8192):
+        self.capacity = capacity
+        self.timestamps = np.zeros(capacity, dtype=np.float64)
+        self.market_caps = np.zeros(capacity, dtype=np.float64)
+        self.sol_amounts = np.zeros(capacity, dtype=np.float64)
+        self.trade_counts = np.zeros(capacity, dtype=np.int64)  # Trades coalesced into each row
+        self.count = 0  # Total rows ever appended
+        
+    def __len__(self):
+        return min(self.count, self.capacity)
+        
+    def append(self, timestamp, market_cap_sol, sol_amount, trades=1):
+        """Store one trade or coalesced update, overwriting the oldest slot when full"""
+        i = self.count % self.capacity
+        self.timestamps[i] = timestamp
+        self.market_caps[i] = market_cap_sol
+        self.sol_amounts[i] = sol_amount
+        self.trade_counts[i] = trades
+        self.count += 1
+        
+    def latest(self):
+        """Return (timestamp, market cap) of the newest trade"""
+        if self.count == 0:
+            return None, None
+        i = (self.count - 1) % self.capacity
+        return self.timestamps[i], self.market_caps[i]
+        
+    def ordered(self):
+        """Return (timestamps, market caps, sol amounts, trade counts) oldest first"""
+        columns = (self.timestamps, self.market_caps, self.sol_amounts, self.trade_counts)
+        n = len(self)
+        if self.count <= self.capacity:
+            return tuple(column[:n] for column in columns)
+        i = self.count % self.capacity
+        return tuple(np.concatenate((column[i:], column[:i])) for column in columns)
+                
+    def snapshot(self, limit=1024):
+        """Newest `limit` trades as plain lists"""
+        timestamps, market_caps, sol_amounts, trade_counts = self.ordered()
+        return {
+            'timestamps': timestamps[-limit:].tolist(),
+            'market_caps': market_caps[-limit:].tolist(),
+            'sol_amounts': sol_amounts[-limit:].tolist(),
+            'trade_counts': trade_counts[-limit:].tolist()
+        }
+        
+    def restore(self, state):
+        """Append trades saved by `snapshot`"""
+        trade_counts = state.get('trade_counts') or [1] * len(state['timestamps'])
+        for row in zip(state['timestamps'], state['market_caps'], state['sol_amounts'], trade_counts):
+            self.append(*row)
+            
+    def window(self, seconds, now=None):
+        """Return (change %, trade count, sol volume) over the last `seconds`"""
+        if self.count == 0:
+            return 0.0, 0, 0.0
+        now = time.time() if now is None else now
+        timestamps, market_caps, sol_amounts, trade_counts = self.ordered()
+        start = np.searchsorted(timestamps, now - seconds, side='left')
+        trades = trade_counts[start:].sum()
+        volume = float(sol_amounts[start:].sum())
+        
+        # Compare against the market cap in effect when the window opened
+        reference = market_caps[start - 1] if start > 0 else market_caps[0]
+        current = market_caps[-1]
+        change = ((current - reference) / reference) * 100 if reference else 0.0
+        return float(change), int(trades), volume
+# Only the fields the trackers use are pulled out of each trade message
+TRADE_FIELDS = re.compile(r'"(mint|marketCapSol|solAmount)"\s*:\s*(?:"([^"]*)"|(-?[0-9][0-9.eE+-]*))')
+
+def decode_trade(message):
+    """Return (mint, market cap in SOL, sol amount) from a raw trade message, or None"""
+    if orjson:
+        data = orjson.loads(message)
+        if not isinstance(data, dict) or 'mint' not in data or 'marketCapSol' not in data:
+            return None
+        return data['mint'], float(data['marketCapSol']), float(data.get('solAmount') or 0)
+        
+    fields = {name: text or number for name, text, number in TRADE_FIELDS.findall(message)}
+    if 'mint' not in fields or 'marketCapSol' not in fields:
+        return None  # Subscription confirmations and other notices
+    return fields['mint'], float(fields['marketCapSol']), float(fields.get('solAmount') or 0)
+
+class PumpPortalConnection:
+    """Single PumpPortal WebSocket multiplexing trade streams for many tokens"""
+    uri = os.getenv("PUMPPORTAL_URI", "wss://pumpportal.fun/api/data")
+    _shared = None
+    
+    def __init__(self, buffer_size=8192, max_pending=10000, drop_policy="oldest", coalesce_interval=0):
+        self.buffer_size = buffer_size
+        self.max_pending = max_pending              # Raw messages held between the socket and ingest
+        self.drop_policy = drop_policy              # 'oldest' or 'newest' message is dropped when full
+        self.coalesce_interval = coalesce_interval  # Seconds per tick, 0 records every trade
+        self.pending = deque()
+        self.pending_ready = asyncio.Event()
+        self.dropped = 0        # messages dropped because the queue was full
+        self.malformed = 0      # messages that could not be decoded
+        self.ingest_task = None
+        self.series = {}        # mint -> SeriesStore receiving every trade
         self.websocket = None
-        self.last_market_cap = None
+        self.subscribed = set()
+        self.listeners = set()  # callables (mint, timestamp, market cap, sol amount, largest trade)
+        self.buffers = {}       # mint -> TradeBuffer
+        self.first_trade = {}   # mint -> asyncio.Event
+        self.reader_task = None
+        
+    @classmethod
+    def shared(cls):
+        """Process-wide connection shared by every tracker"""
+        if cls._shared is None:
+            cls._shared = cls(
+                max_pending=int(os.getenv("TRADE_QUEUE_SIZE", "10000")),
+                drop_policy=os.getenv("TRADE_DROP_POLICY", "oldest"),
+                coalesce_interval=float(os.getenv("TRADE_COALESCE_INTERVAL", "0"))
+            )
+        return cls._shared
+        
+    def buffer(self, mint):
+        """Per-token ring buffer, created on first use"""
+        if mint not in self.buffers:
+            self.buffers[mint] = TradeBuffer(self.buffer_size)
+            self.first_trade[mint] = asyncio.Event()
+        return self.buffers[mint]
+        
+    async def send(self, method, keys):
+        """Send a subscription payload if the socket is open"""
+        if self.websocket and keys:
+            await self.websocket.send(json.dumps({"method": method, "keys": list(keys)}))
+            
+    async def subscribe(self, *mints):
+        """Start routing trades for `mints` without reconnecting"""
+        new = [mint for mint in mints if mint not in self.subscribed]
+        for mint in new:
+            self.subscribed.add(mint)
+            self.buffer(mint)
+        self.start()
+        await self.send("subscribeTokenTrade", new)
+        
+    async def unsubscribe(self, *mints):
+        """Stop receiving trades for `mints` and drop their buffers"""
+        gone = [mint for mint in mints if mint in self.subscribed]
+        for mint in gone:
+            self.subscribed.discard(mint)
+            self.buffers.pop(mint, None)
+            self.first_trade.pop(mint, None)
+        await self.send("unsubscribeTokenTrade", gone)
         
     async def connect(self):
-        """Establish WebSocket connection"""
+        """Establish WebSocket connection and subscribe every known token"""
         try:
-            uri = "wss://pumpportal.fun/api/data"
-            print("Attempting WebSocket connection...")
-            self.websocket = await websockets.connect(uri)
+            log("Attempting WebSocket connection...")
+            self.websocket = await websockets.connect(self.uri)
+            metrics.inc("websocket_connects_total")
             
-            payload = {
-                "method": "subscribeTokenTrade",
-                "keys": [self.token]
-            }
-            print("Sending subscription payload...")
-            await self.websocket.send(json.dumps(payload))
+            log(f"Subscribing to {len(self.subscribed)} token(s)...")
+            await self.send("subscribeTokenTrade", self.subscribed)
             
-            # Skip subscription confirmation
-            print("Waiting for subscription confirmation...")
-            confirmation = await self.websocket.recv()
-            print(f"Subscription response: {confirmation}")
-            
-            print("Connected and subscribed to PumpPortal WebSocket")
+            log("Connected and subscribed to PumpPortal WebSocket")
             return True
             
         except Exception as e:
-            print(f"WebSocket connection error: {e}")
+            log(f"WebSocket connection error: {e}", level="error")
             self.websocket = None
             return False
             
-    async def get_price(self):
-        """Get price from PumpFun"""
-        try:
+    def start(self):
+        """Start the background trade reader and ingest tasks if they are not running"""
+        if self.reader_task is None or self.reader_task.done():
+            self.reader_task = asyncio.create_task(self.read_trades())
+        if self.ingest_task is None or self.ingest_task.done():
+            metrics.gauge("trade_queue_depth", lambda: len(self.pending))
+            self.pending_ready = asyncio.Event()
+            self.ingest_task = asyncio.create_task(self.ingest())
+        return self.reader_task
+        
+    async def stop(self):
+        """Stop the background trade reader and close the socket"""
+        for task in (self.reader_task, self.ingest_task):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self.reader_task = None
+        self.ingest_task = None
+        if self.websocket:
+            await self.websocket.close()
+            self.websocket = None
+            
+    async def read_trades(self):
+        """Drain the trade stream into per-token buffers, reconnecting on errors"""
+        backoff = 1
+        while True:
             if not self.websocket:
                 if not await self.connect():
-                    print("Failed to connect to WebSocket")
-                    return None, None
-                    
-            print("Waiting for trade data...")
-            message = await self.websocket.recv()
-            data = json.loads(message)
-            print(f"Received trade data: {data}")
-            
-            if 'marketCapSol' in data:
-                market_cap_sol = float(data['marketCapSol'])
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, 60)
+                    continue
+                backoff = 1
                 
-                # Calculate price change from market cap
-                if self.last_market_cap:
-                    market_cap_change = ((market_cap_sol - self.last_market_cap) / self.last_market_cap) * 100
-                else:
-                    market_cap_change = 0
-                    
-                self.last_market_cap = market_cap_sol
-                self.last_check_time = time.time()
+            try:
+                async for message in self.websocket:
+                    self.enqueue(message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log(f"PumpFun trade stream error: {e}", level="error")
                 
-                print(f"\n=== Current Market Cap: {market_cap_sol:.2f} SOL ===")
-                print(f"=== Market Cap Change: {market_cap_change:.2f}% ===\n")
+            # Stream ended or failed, reconnect on the next pass
+            self.websocket = None
+            metrics.inc("reconnects_total")
+            
+    def enqueue(self, message):
+        """Hand a raw message to the ingest task, dropping per policy when full"""
+        if len(self.pending) >= self.max_pending:
+            self.dropped += 1
+            metrics.inc("trades_dropped_total", reason="queue_full")
+            if self.drop_policy != "oldest":
+                return
+            self.pending.popleft()
+        self.pending.append(message)
+        self.pending_ready.set()
+        
+    async def ingest(self):
+        """Decode queued messages in batches, coalescing per mint when enabled"""
+        while True:
+            await self.pending_ready.wait()
+            if self.coalesce_interval:
+                await asyncio.sleep(self.coalesce_interval)
+            self.pending_ready.clear()
+            batch, self.pending = self.pending, deque()
+            try:
+                with metrics.timer("ingest"):
+                    self.ingest_batch(batch)
+                metrics.inc("messages_total", len(batch))
+            except Exception as e:
+                log(f"PumpFun trade ingest error: {e}", level="error")
                 
-                return market_cap_sol, market_cap_change
+    def decode(self, message):
+        """decode_trade that counts and skips a malformed message instead of failing the batch"""
+        try:
+            return decode_trade(message)
+        except (ValueError, TypeError) as e:
+            self.malformed += 1
+            metrics.inc("trades_dropped_total", reason="malformed")
+            if self.malformed == 1 or self.malformed % 1000 == 0:
+                log(f"Skipped malformed trade message ({self.malformed} so far): {e}", level="warning")
+            return None
+            
+    def ingest_batch(self, batch):
+        """Record a batch of raw messages"""
+        if not self.coalesce_interval:
+            for message in batch:
+                trade = self.decode(message)
+                if trade:
+                    self.record_trade(*trade)
+            return
+            
+        # One update per mint per tick: latest market cap, summed volume, trade count, largest trade
+        updates = {}
+        for message in batch:
+            trade = self.decode(message)
+            if trade:
+                mint, market_cap_sol, sol_amount = trade
+                update = updates.setdefault(mint, [0.0, 0.0, 0, 0.0])
+                update[0] = market_cap_sol
+                update[1] += sol_amount
+                update[2] += 1
+                update[3] = max(update[3], sol_amount)
+        for mint, (market_cap_sol, sol_amount, trades, largest) in updates.items():
+            self.record_trade(mint, market_cap_sol, sol_amount, trades, largest)
+            
+    def record_trade(self, mint, market_cap_sol, sol_amount, trades=1, largest=None):
+        """Route a decoded trade or coalesced update to its token's ring buffer"""
+        if mint not in self.subscribed:
+            return  # Unsubscribed tokens
+        largest = sol_amount if largest is None else largest
+        now = time.time()
+        metrics.inc("trades_total", trades)
+        self.buffer(mint).append(now, market_cap_sol, sol_amount, trades)
+        series = self.series.get(mint)
+        if series:
+            series.append(mint, now, market_cap_sol, sol_amount)
+        self.first_trade[mint].set()
+        for listener in list(self.listeners):
+            # One failing listener must not stop routing or the other listeners
+            try:
+                listener(mint, now, market_cap_sol, sol_amount, largest)
+            except Exception as e:
+                log(f"Trade listener error for {mint}: {e}", level="error")
+
+class PumpFunTracker(PriceTracker):
+    """Phase 1: PumpFun price tracking via a shared WebSocket"""
+    windows = {'1m': 60, '5m': 300, '1h': 3600}
+    migration_cap = 420  # SOL market cap at which the token moves to Phase 2
+    
+    def __init__(self, token, connection=None):
+        super().__init__(token, check_interval=300)  # 5 minutes
+        self.connection = connection or PumpPortalConnection.shared()
+        self.buffer = self.connection.buffer(token)
+        self.last_market_cap = None
+        self.last_stats = None
+        
+    async def start(self):
+        """Subscribe this token on the shared connection"""
+        await self.connection.subscribe(self.token)
+        self.buffer = self.connection.buffer(self.token)
+        
+    async def stop(self):
+        """Unsubscribe this token, leaving the connection up for others"""
+        await self.connection.unsubscribe(self.token)
+        
+    def stats(self, now=None):
+        """Latest market cap with change, trade count and SOL volume per window"""
+        timestamp, market_cap_sol = self.buffer.latest()
+        if market_cap_sol is None:
+            return None
+        stats = {'market_cap': float(market_cap_sol), 'timestamp': float(timestamp)}
+        for name, seconds in self.windows.items():
+            change, trades, volume = self.buffer.window(seconds, now)
+            stats[f'change_{name}'] = change
+            stats[f'trades_{name}'] = trades
+            stats[f'volume_{name}'] = volume
+        return stats
+        
+    def snapshot(self):
+        state = super().snapshot()
+        state['last_market_cap'] = self.last_market_cap
+        state['trades'] = self.buffer.snapshot()
+        return state
+        
+    def restore(self, state):
+        super().restore(state)
+        self.last_market_cap = state.get('last_market_cap')
+        # A warm buffer means another tracker on this connection already has history
+        if state.get('trades') and self.buffer.count == 0:
+            self.buffer.restore(state['trades'])
+            
+    async def get_price(self, timeout=30):
+        """Get latest market cap and change over the check interval from the buffer"""
+        try:
+            await self.start()
+            first_trade = self.connection.first_trade[self.token]
+            if not first_trade.is_set():
+                log("Waiting for trade data...")
+                await asyncio.wait_for(first_trade.wait(), timeout)
                 
-            return None, None
+            stats = self.stats()
+            market_cap_sol = stats['market_cap']
+            market_cap_change, _, _ = self.buffer.window(self.check_interval)
             
+            self.last_stats = stats
+            self.last_market_cap = market_cap_sol
+            self.last_check_time = time.time()
+            
+            log(f"\n=== Current Market Cap: {market_cap_sol:.2f} SOL ===")
+            log(f"=== Market Cap Change: {market_cap_change:.2f}% ===")
+            log(f"=== 1m: {stats['change_1m']:.2f}% | 5m: {stats['change_5m']:.2f}% | 1h: {stats['change_1h']:.2f}% ===")
+            log(f"=== Trades (5m): {stats['trades_5m']} | Volume (5m): {stats['volume_5m']:.2f} SOL ===\n")
+            
+            return market_cap_sol, market_cap_change
+            
+        except asyncio.TimeoutError:
+            log("No trade data received yet", level="warning")
+            return None, None
         except Exception as e:
-            print(f"PumpFun price fetch error: {e}")
-            self.websocket = None
+            log(f"PumpFun price fetch error: {e}", level="error")
             return None, None
             
     def should_migrate(self):
         """Check if should migrate to Phase 2"""
-        return self.last_market_cap is not None and self.last_market_cap >= 420
+        return self.last_market_cap is not None and self.last_market_cap >= self.migration_cap
+
+class HttpPool:
+    """Keep-alive aiohttp session, recreated when the event loop changes"""
+    def __init__(self, limit=10, timeout=15):
+        self.limit = limit
+        self.timeout = timeout
+        self.session = None
+        self.loop = None
+        
+    def get_session(self):
+        """Pooled session bound to the running event loop"""
+        loop = asyncio.get_running_loop()
+        if self.session is None or self.session.closed or self.loop is not loop:
+            connector = aiohttp.TCPConnector(limit=self.limit, keepalive_timeout=60)
+            self.session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout))
+            self.loop = loop
+        return self.session
+        
+    async def close(self):
+        """Close the connection pool"""
+        if self.session and not self.session.closed:
+            await self.session.close()
+        self.session = None
+        
+    async def download(self, url, chunk_size=64 * 1024):
+        """Stream `url` into an in-memory buffer"""
+        buffer = io.BytesIO()
+        async with self.get_session().get(url) as response:
+            if response.status != 200:
+                raise Exception(f"Failed to download {url}: status {response.status}")
+            async for chunk in response.content.iter_chunked(chunk_size):
+                buffer.write(chunk)
+        buffer.seek(0)
+        return buffer
+
+class DexScreenerClient(HttpPool):
+    """Async DexScreener client with a keep-alive pool, batching and a TTL cache"""
+    base_url = os.getenv("DEXSCREENER_URL", "https://api.dexscreener.com/latest/dex/tokens/")
+    batch_size = 30  # Max comma-separated addresses per request
+    _shared = None
+    
+    def __init__(self, cache_ttl=30):
+        super().__init__()
+        self.cache_ttl = cache_ttl
+        self.tokens = set()
+        self.cache = {}  # token -> (fetched_at, pair)
+        self.lock = None
+        
+    @classmethod
+    def shared(cls):
+        """Process-wide client shared by every tracker"""
+        if cls._shared is None:
+            cls._shared = cls()
+        return cls._shared
+        
+    def get_session(self):
+        """Pooled session plus a fetch lock bound to the running event loop"""
+        loop = self.loop
+        session = super().get_session()
+        if self.lock is None or self.loop is not loop:
+            self.lock = asyncio.Lock()
+        return session
+        
+    def register(self, token):
+        """Include `token` in every batched request"""
+        self.tokens.add(token)
+        
+    def expired(self, token, now):
+        cached = self.cache.get(token)
+        return cached is None or now - cached[0] > self.cache_ttl
+        
+    async def fetch(self, tokens):
+        """Fetch the top pair for many tokens using one request per batch"""
+        session = self.get_session()
+        tokens = list(tokens)
+        for i in range(0, len(tokens), self.batch_size):
+            batch = tokens[i:i + self.batch_size]
+            metrics.inc("api_calls_total", api="dexscreener")
+            with metrics.timer("dexscreener"):
+                async with session.get(self.base_url + ",".join(batch)) as response:
+                    if response.status != 200:
+                        log(f"DexScreener request failed with status {response.status}", level="error")
+                        continue
+                    data = await response.json()
+                
+            # Pairs come back mixed across tokens, keep the first one listed for each
+            pairs = {}
+            for pair in (data or {}).get('pairs') or []:
+                address = pair.get('baseToken', {}).get('address')
+                if address in batch and address not in pairs:
+                    pairs[address] = pair
+                    
+            fetched_at = time.time()
+            for token in batch:
+                self.cache[token] = (fetched_at, pairs.get(token))
+                
+    async def get_pair(self, token):
+        """Return the cached pair for `token`, refreshing every stale token at once"""
+        self.register(token)
+        self.get_session()
+        async with self.lock:
+            now = time.time()
+            if self.expired(token, now):
+                await self.fetch([t for t in self.tokens if self.expired(t, now)])
+        cached = self.cache.get(token)
+        return cached[1] if cached else None
 
 class DexScreenerTracker(PriceTracker):
     """Phase 2: DexScreener price tracking"""
-    def __init__(self, token):
+    def __init__(self, token, client=None, series=None):
         super().__init__(token, check_interval=900)  # 15 minutes
+        self.client = client or DexScreenerClient.shared()
+        self.client.register(token)
+        self.series = series  # Optional SeriesStore receiving every sample
         
     async def get_price(self):
         """Get price from DexScreener"""
         try:
-            url = f"https://api.dexscreener.com/latest/dex/tokens/{self.token}"
-            response = requests.get(url)
-            
-            if response.status_code == 200:
-                data = response.json()
-                if data and 'pairs' in data and len(data['pairs']) > 0:
-                    pair = data['pairs'][0]
-                    price = float(pair['priceUsd'])
-                    price_change = float(pair['priceChange']['h1'])
-                    
-                    self.last_price = price
-                    self.last_check_time = time.time()
-                    
-                    return price, price_change
-                    
+            pair = await self.client.get_pair(self.token)
+            if pair:
+                price = float(pair['priceUsd'])
+                price_change = float(pair['priceChange']['h1'])
+                
+                self.last_price = price
+                self.last_check_time = time.time()
+                if self.series:
+                    volume = float((pair.get('volume') or {}).get('h1', 0))
+                    self.series.append(self.token, self.last_check_time, price, volume)
+                    self.series.flush(self.token)
+                
+                return price, price_change
+                
             return None, None
             
         except Exception as e:
-            print(f"DexScreener price fetch error: {e}")
+            log(f"DexScreener price fetch error: {e}", level="error")
             return None, None
 
+class ImagePool:
+    """On-disk pool of pre-generated images per mood with background refill"""
+    def __init__(self, generate, http, directory="image_pool", size=3, low_water=1,
+                 capacity=6, max_uses=3, ttl=7 * 24 * 3600):
+        self.generate = generate  # async mood -> image URL
+        self.http = http
+        self.directory = directory
+        self.size = size              # Images to hold per mood after a refill
+        self.low_water = low_water    # Refill when fewer usable images remain
+        self.capacity = capacity      # Max images per mood kept on disk
+        self.max_uses = max_uses      # Retire an image after this many posts
+        self.ttl = ttl                # Retire an image after this many seconds
+        self.index_path = os.path.join(directory, "index.json")
+        self.entries = self.load()    # mood -> [{path, created, last_used, uses, retired}]
+        self.refills = {}             # mood -> refill task
+        self.stored = {}              # mood -> event set whenever an image is added
+        self.in_use = None            # Optional callable returning image paths queued posts still need
+        
+    def load(self):
+        """Load pool metadata, dropping entries whose files are gone"""
+        try:
+            with open(self.index_path) as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return {mood: [e for e in items if os.path.exists(e['path'])] for mood, items in entries.items()}
+        
+    def save(self):
+        """Write pool metadata atomically"""
+        os.makedirs(self.directory, exist_ok=True)
+        temp_path = self.index_path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(self.entries, f)
+        os.replace(temp_path, self.index_path)
+        
+    def usable(self, mood):
+        return [e for e in self.entries.get(mood, []) if e['uses'] < self.max_uses and not e.get('retired')]
+        
+    def evict(self, mood, now=None):
+        """Drop expired, worn out and least recently used images for `mood`"""
+        now = time.time() if now is None else now
+        pinned = set(self.in_use()) if self.in_use else set()
+        keep, drop = [], []
+        for entry in self.entries.get(mood, []):
+            # Worn out images stay on disk briefly so posts still being generated can use them
+            worn = entry['uses'] >= self.max_uses and now - entry['last_used'] > 600
+            expired = entry.get('retired') or now - entry['created'] > self.ttl or worn
+            (drop if expired else keep).append(entry)
+            
+        keep.sort(key=lambda e: e['last_used'], reverse=True)
+        drop.extend(keep[self.capacity:])
+        
+        # Images a queued post still references are retired but stay on disk until it is sent
+        retired = [entry for entry in drop if entry['path'] in pinned]
+        for entry in retired:
+            entry['retired'] = True
+        self.entries[mood] = keep[:self.capacity] + retired
+        
+        for entry in drop:
+            if entry['path'] in pinned:
+                continue
+            try:
+                os.remove(entry['path'])
+            except OSError:
+                pass
+        return len(drop) - len(retired)
+        
+    def take(self, mood, refill=True):
+        """Return a local image path for `mood` or None if the pool is empty"""
+        self.evict(mood)
+        candidates = self.usable(mood)
+        if refill and len(candidates) <= self.low_water:
+            self.refill(mood)
+        if not candidates:
+            return None
+            
+        # Prefer the least used image, then the one idle the longest
+        entry = min(candidates, key=lambda e: (e['uses'], e['last_used']))
+        entry['uses'] += 1
+        entry['last_used'] = time.time()
+        self.save()
+        return entry['path']
+        
+    async def acquire(self, mood):
+        """Local image path for `mood`, waiting for the refill's first image on a miss"""
+        # The refill is the only generator so a miss never costs an extra image call
+        image = self.take(mood)
+        while image is None:
+            refill = self.refills.get(mood)
+            if refill is None or refill.done():
+                return None
+            stored = self.stored.setdefault(mood, asyncio.Event())
+            waiter = asyncio.ensure_future(stored.wait())
+            try:
+                await asyncio.wait({waiter, refill}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                waiter.cancel()
+            stored.clear()
+            image = self.take(mood, refill=False)
+        return image
+        
+    def refill(self, mood):
+        """Top up `mood` in the background unless a refill is already running"""
+        task = self.refills.get(mood)
+        if task is None or task.done():
+            self.refills[mood] = asyncio.create_task(self.fill(mood, self.size))
+        return self.refills[mood]
+        
+    async def fill(self, mood, count):
+        """Generate and store images until `mood` has `count` usable ones"""
+        while len(self.usable(mood)) < count:
+            image_url = await self.generate(mood)
+            if not image_url or not await self.add(mood, image_url):
+                log(f"Image pool refill for {mood} stopped", level="warning")
+                return
+                
+    async def add(self, mood, image_url):
+        """Download `image_url` into the pool"""
+        try:
+            content = (await self.http.download(image_url)).getvalue()
+            os.makedirs(os.path.join(self.directory, mood), exist_ok=True)
+            now = time.time()
+            path = os.path.join(self.directory, mood, f"{int(now * 1000)}-{os.urandom(4).hex()}.png")
+            with open(path, "wb") as f:
+                f.write(content)
+                
+            self.entries.setdefault(mood, []).append({'path': path, 'created': now, 'last_used': 0, 'uses': 0})
+            self.evict(mood, now)
+            self.save()
+            if mood in self.stored:
+                self.stored[mood].set()
+            log(f"Stored {mood} image in pool: {path}")
+            return True
+            
+        except Exception as e:
+            log(f"Error storing pool image: {e}", level="error")
+            return False
+            
+    async def prewarm(self, moods, count=None, concurrency=3):
+        """Fill every mood in `moods` up to `count` images"""
+        count = count or self.size
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        async def fill(mood):
+            async with semaphore:
+                await self.fill(mood, count)
+                
+        await asyncio.gather(*(fill(mood) for mood in moods))
+        
+    async def wait(self):
+        """Wait for background refills to finish"""
+        await asyncio.gather(*self.refills.values(), return_exceptions=True)
+
+class TweetPool:
+    """Per-mode pool of pre-generated tweet candidates with near-duplicate filtering"""
+    def __init__(self, generate, path="tweet_pool.json", batch_size=8, low_water=2,
+                 history=50, similarity=0.6):
+        self.generate = generate          # async (mode, n) -> [tweet text]
+        self.path = path
+        self.batch_size = batch_size      # Candidates requested per API call
+        self.low_water = low_water        # Refill when fewer candidates remain
+        self.similarity = similarity      # Jaccard score treated as a duplicate
+        self.candidates = {}              # mode -> [tweet text]
+        self.posted = deque(maxlen=history)
+        self.refills = {}                 # mode -> refill task
+        self.load()
+        
+    def load(self):
+        """Load stored candidates and recently posted tweets"""
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.candidates = data.get('candidates', {})
+        self.posted.extend(data.get('posted', []))
+        
+    def save(self):
+        """Write the pool atomically"""
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump({'candidates': self.candidates, 'posted': list(self.posted)}, f)
+        os.replace(temp_path, self.path)
+        
+    @staticmethod
+    def shingles(text):
+        words = ''.join(c if c.isalnum() else ' ' for c in text.lower()).split()
+        return set(zip(words, words[1:])) or set(words)
+        
+    def is_duplicate(self, text, others):
+        """True if `text` is too similar to any of `others`"""
+        mine = self.shingles(text)
+        for other in others:
+            theirs = self.shingles(other)
+            if mine and theirs and len(mine & theirs) / len(mine | theirs) >= self.similarity:
+                return True
+        return False
+        
+    def add(self, mode, texts):
+        """Store new candidates, skipping near-duplicates of pooled or posted tweets"""
+        pool = self.candidates.setdefault(mode, [])
+        added = 0
+        for text in texts:
+            if text and not self.is_duplicate(text, pool + list(self.posted)):
+                pool.append(text)
+                added += 1
+        self.save()
+        return added
+        
+    def take(self, mode):
+        """Pop a candidate for `mode` that is not a near-duplicate of a recent post"""
+        pool = self.candidates.get(mode, [])
+        text = None
+        while pool and text is None:
+            candidate = pool.pop(0)
+            if not self.is_duplicate(candidate, self.posted):
+                text = candidate
+        if len(pool) < self.low_water:
+            self.refill(mode)
+        self.save()
+        return text
+        
+    def mark_posted(self, text):
+        """Remember a posted tweet for duplicate filtering"""
+        self.posted.append(text)
+        self.save()
+        
+    def refill(self, mode):
+        """Top up `mode` in the background unless a refill is already running"""
+        task = self.refills.get(mode)
+        if task is None or task.done():
+            self.refills[mode] = asyncio.create_task(self.fill(mode))
+        return self.refills[mode]
+        
+    async def fill(self, mode):
+        """Request one batch of candidates for `mode`"""
+        try:
+            return self.add(mode, await self.generate(mode, self.batch_size))
+        except Exception as e:
+            log(f"Tweet pool refill for {mode} failed: {e}", level="error")
+            return 0
+            
+    async def draw(self, mode):
+        """Take a candidate, waiting for a refill on a miss"""
+        text = self.take(mode)
+        while text is None:
+            if not await self.refill(mode):
+                raise Exception(f"No tweet candidates available for {mode}")
+            text = self.take(mode)
+        return text
+        
+    async def wait(self):
+        """Wait for background refills to finish"""
+        await asyncio.gather(*self.refills.values(), return_exceptions=True)
+
+def recompress_image(data, image_format, quality, size, strip_metadata):
+    """Re-encode image bytes, runs inside an executor"""
+    with Image.open(io.BytesIO(data)) as original:
+        image = original.convert("RGB")
+        if size and max(image.size) > size:
+            image.thumbnail((size, size), Image.LANCZOS)
+            
+        params = {'quality': quality}
+        if image_format == "JPEG":
+            params['optimize'] = True
+        if not strip_metadata:
+            for key in ('exif', 'icc_profile'):
+                if original.info.get(key):
+                    params[key] = original.info[key]
+                    
+        output = io.BytesIO()
+        image.save(output, image_format, **params)
+    return output.getvalue()
+
+class ImageProcessor:
+    """Recompress images before upload, caching results by source image"""
+    extensions = {'JPEG': 'jpg', 'WEBP': 'webp'}
+    
+    def __init__(self, image_format="JPEG", quality=85, size=1024, strip_metadata=True,
+                 cache_dir="image_cache", workers=2, cache_size=64, cache_ttl=7 * 24 * 3600):
+        self.image_format = image_format.upper()
+        self.quality = quality
+        self.size = size
+        self.strip_metadata = strip_metadata
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self.cache_size = cache_size  # Max cached images, least recently used go first
+        self.cache_ttl = cache_ttl    # Cached images unused for this many seconds are removed
+        self.executor = None
+        
+    @classmethod
+    def from_env(cls, cache_dir="image_cache"):
+        """Build from IMAGE_* settings, or None when IMAGE_FORMAT is 'none'"""
+        image_format = os.getenv("IMAGE_FORMAT", "JPEG")
+        if image_format.lower() in ("", "none", "off"):
+            return None
+        return cls(
+            image_format=image_format,
+            quality=int(os.getenv("IMAGE_QUALITY", "85")),
+            size=int(os.getenv("IMAGE_SIZE", "1024")),
+            strip_metadata=os.getenv("IMAGE_STRIP_METADATA", "1") != "0",
+            cache_dir=cache_dir,
+            cache_size=int(os.getenv("IMAGE_CACHE_SIZE", "64"))
+        )
+        
+    @property
+    def filename(self):
+        return f"mood.{self.extensions.get(self.image_format, self.image_format.lower())}"
+        
+    def cache_path(self, data):
+        """Cache file for `data` under the current settings"""
+        key = hashlib.sha256(data)
+        key.update(f"{self.image_format}:{self.quality}:{self.size}:{self.strip_metadata}".encode())
+        return os.path.join(self.cache_dir, f"{key.hexdigest()}.{self.filename.split('.')[-1]}")
+        
+    async def process(self, image):
+        """Return (buffer, upload filename) for the recompressed `image` buffer"""
+        data = image.getvalue()
+        path = self.cache_path(data)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)  # Recently used entries survive pruning
+            return io.BytesIO(data), self.filename
+            
+        if self.executor is None:
+            # Threads, not processes: Pillow releases the GIL while encoding and shard
+            # workers are daemonic processes that may not start children of their own
+            self.executor = concurrent.futures.ThreadPoolExecutor(self.workers, thread_name_prefix="recompress")
+        loop = asyncio.get_running_loop()
+        with metrics.timer("recompress"):
+            output = await loop.run_in_executor(
+                self.executor, recompress_image,
+                data, self.image_format, self.quality, self.size, self.strip_metadata
+            )
+        log(f"Recompressed image {len(data)} -> {len(output)} bytes")
+        
+        os.makedirs(self.cache_dir, exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(output)
+        os.replace(temp_path, path)
+        self.prune()
+        return io.BytesIO(output), self.filename
+        
+    def prune(self, now=None):
+        """Remove stale cache entries and keep at most cache_size of the most recently used"""
+        now = time.time() if now is None else now
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".tmp"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                entries.append((os.path.getmtime(path), path))
+            except OSError:
+                pass
+        entries.sort(reverse=True)
+        removed = 0
+        for i, (used, path) in enumerate(entries):
+            if i >= self.cache_size or now - used > self.cache_ttl:
+                try:
+                    os.remove(path)
+                    removed += 1
+                except OSError:
+                    pass
+        return removed
+        
+    def shutdown(self):
+        if self.executor:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+class SignalEngine:
+    """Vectorized mood classification with hysteresis and a minimum dwell time"""
+    # A change above thresholds[i - 1] and at or below thresholds[i] maps to moods[i]
+    thresholds = np.array([-100, -50, -10, 0, 10, 50, 100], dtype=np.float64)
+    moods = np.array([
+        'its_over',       # <=-100% (melting/shattered)
+        'max_cope',       # -100--50% (breaking down)
+        'worried',        # -50--10% (visible stress)
+        'this_is_fine',   # -10-0% (slight worry)
+        'optimistic',     # 0-10% (slight smile)
+        'cookin',         # 10-50% (confident glow)
+        'bullish',        # 50-100% (floating, victory)
+        'gigabullish'     # >100% (laser eyes, explosions)
+    ])
+    
+    _shared = None
+    
+    def __init__(self, hysteresis=2.0, min_dwell=600):
+        self.hysteresis = hysteresis  # Percentage points a change must clear a threshold by
+        self.min_dwell = min_dwell    # Seconds a mood is held before it may change
+        self.keys = {}                # key -> row in the state arrays
+        self.current = np.zeros(0, dtype=np.int64)
+        self.entered = np.zeros(0, dtype=np.float64)
+        
+    @classmethod
+    def shared(cls):
+        """Process-wide engine, keys are tokens so every bot can share it"""
+        if cls._shared is None:
+            cls._shared = cls(
+                hysteresis=float(os.getenv("MOOD_HYSTERESIS", "2.0")),
+                min_dwell=float(os.getenv("MOOD_MIN_DWELL", "600"))
+            )
+        return cls._shared
+        
+    def classify(self, changes):
+        """Mood index for every change in one pass"""
+        return np.searchsorted(self.thresholds, np.asarray(changes, dtype=np.float64), side='left')
+        
+    def mood(self, change):
+        """Mood name for a single change without hysteresis"""
+        return str(self.moods[self.classify(change)])
+        
+    def rows(self, keys):
+        """State rows for `keys`, adding unseen keys with no mood yet"""
+        new = [key for key in dict.fromkeys(keys) if key not in self.keys]
+        if new:
+            for key in new:
+                self.keys[key] = len(self.keys)
+            self.current = np.concatenate((self.current, np.full(len(new), -1, dtype=np.int64)))
+            self.entered = np.concatenate((self.entered, np.full(len(new), -np.inf)))
+        return np.fromiter((self.keys[key] for key in keys), dtype=np.int64, count=len(keys))
+        
+    def seed(self, key, mood, entered):
+        """Restore the mood `key` was last posted in"""
+        if mood in self.moods:
+            row = self.rows([key])[0]
+            self.current[row] = int(np.flatnonzero(self.moods == mood)[0])
+            self.entered[row] = entered or -np.inf
+            
+    def update_many(self, keys, changes, now=None):
+        """Feed one change per key and return [(key, mood)] for keys whose mood changed"""
+        now = time.time() if now is None else now
+        changes = np.asarray(changes, dtype=np.float64)
+        rows = self.rows(keys)
+        current = self.current[rows]
+        
+        # Moving up must clear the crossed threshold by the margin, same for moving down
+        up = self.classify(changes - self.hysteresis)
+        down = self.classify(changes + self.hysteresis)
+        proposed = np.where(up > current, up, np.where(down < current, down, current))
+        proposed = np.where(current < 0, self.classify(changes), proposed)
+        
+        settled = (now - self.entered[rows]) >= self.min_dwell
+        changed = (proposed != current) & (settled | (current < 0))
+        
+        self.current[rows[changed]] = proposed[changed]
+        self.entered[rows[changed]] = now
+        return [(keys[i], str(self.moods[proposed[i]])) for i in np.flatnonzero(changed)]
+        
+    def update(self, key, change, now=None):
+        """Single-key update returning the new mood or None"""
+        events = self.update_many([key], [change], now)
+        return events[0][1] if events else None
+        
+    def replay(self, times, changes):
+        """[(index, mood)] a fresh key would produce fed `changes` at `times`, as update() would"""
+        times = np.asarray(times, dtype=np.float64)
+        changes = np.asarray(changes, dtype=np.float64)
+        if len(times) == 0:
+            return []
+        up = self.classify(changes - self.hysteresis)
+        down = self.classify(changes + self.hysteresis)
+        # Indices where a key holding each mood would propose leaving it
+        leaving = [np.flatnonzero((up > mood) | (down < mood)) for mood in range(len(self.moods))]
+        
+        # Jump from change to change instead of stepping through every sample
+        i, current = 0, int(self.classify(changes[0]))
+        events = [(0, str(self.moods[current]))]
+        while True:
+            start = max(i + 1, int(np.searchsorted(times, times[i] + self.min_dwell, side='left')))
+            candidates = leaving[current]
+            k = np.searchsorted(candidates, start)
+            if k == len(candidates):
+                return events
+            i = int(candidates[k])
+            current = int(up[i]) if up[i] > current else int(down[i])
+            events.append((i, str(self.moods[current])))
+
+class PostBudget:
+    """Token bucket spreading posts over a daily allowance"""
+    def __init__(self, per_day=17, burst=3):
+        self.rate = per_day / 86400.0
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.time()
+        
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        
+    def resize(self, per_day, burst):
+        """Change the allowance, keeping what has accrued so far up to the new burst"""
+        self.refill(time.time())
+        self.rate = per_day / 86400.0
+        self.capacity = burst
+        self.tokens = min(self.tokens, float(burst))
+        
+    def available(self, now=None):
+        self.refill(time.time() if now is None else now)
+        return self.tokens >= 1
+        
+    def spend(self, now=None):
+        """Take one post from the budget, returning False when exhausted"""
+        if not self.available(now):
+            return False
+        self.tokens -= 1
+        return True
+
+class Scheduler:
+    """Event-driven priority queue of post-worthy events across many tokens"""
+    priorities = {'migration': 0, 'large_trade': 1, 'mood_change': 2}
+    _shared = None
+    
+    def __init__(self, signals, budget=None, tick=1.0, heartbeat=900,
+                 large_trade_sol=5.0, large_trade_cooldown=600, max_age=300):
+        self.signals = signals
+        self.budget = budget or PostBudget()
+        self.tick = tick                      # Seconds between evaluations of tokens with new trades
+        self.heartbeat = heartbeat            # Seconds between fallback samples of every tracker
+        self.large_trade_sol = large_trade_sol
+        self.large_trade_cooldown = large_trade_cooldown
+        self.max_age = max_age                # Unsent events older than this are dropped
+        self.queue = []                       # heap of (priority, time, seq, event)
+        self.seq = 0
+        self.trackers = {}                    # state key -> tracker, Phase 1 and 2 may share a mint
+        self.handlers = {}                    # token -> (async handle(event), posts(event) -> bool)
+        self.streams = {}                     # mint -> PumpFunTracker fed by on_trade
+        self.dirty = set()                    # tokens with trades since the last tick
+        self.migrated = set()
+        self.last_large_trade = {}
+        self.last_heartbeat = 0
+        self.heartbeat_task = None
+        self.inflight = set()                 # running handle() tasks
+        self.dropped = 0
+        self.wakeup = None
+        self.task = None
+        
+    @classmethod
+    def shared(cls):
+        """Process-wide scheduler, one queue and one posting budget for every bot"""
+        if cls._shared is None:
+            cls._shared = cls(
+                SignalEngine.shared(),
+                PostBudget(per_day=float(os.getenv("TWEETS_PER_DAY", "17"))),
+                heartbeat=float(os.getenv("HEARTBEAT_INTERVAL", "900")),
+                large_trade_sol=float(os.getenv("LARGE_TRADE_SOL", "5"))
+            )
+        return cls._shared
+        
+    def start(self):
+        """Run the scheduler loop on the current event loop unless it already runs"""
+        if self.task is None or self.task.done():
+            self.wakeup = asyncio.Event()
+            self.heartbeat_task = None
+            self.task = asyncio.create_task(self.run())
+        return self.task
+        
+    async def stop(self):
+        for task in (self.task, self.heartbeat_task):
+            if task:
+                task.cancel()
+        await asyncio.gather(*(t for t in (self.task, self.heartbeat_task) if t), return_exceptions=True)
+        self.task = self.heartbeat_task = None
+            
+    def watch(self, tracker, handle, posts=None):
+        """Start scheduling events for `tracker`, handled by `handle`
+        
+        `posts(event)` tells whether handling the event really posts, only those spend budget.
+        """
+        self.trackers[tracker.state_key] = tracker
+        self.handlers[tracker.token] = (handle, posts or (lambda event: True))
+        if isinstance(tracker, PumpFunTracker):
+            self.streams[tracker.token] = tracker
+            tracker.connection.listeners.add(self.on_trade)
+            
+    def unwatch(self, tracker):
+        self.trackers.pop(tracker.state_key, None)
+        if not any(t.token == tracker.token for t in self.trackers.values()):
+            self.handlers.pop(tracker.token, None)
+        if self.streams.get(tracker.token) is tracker:
+            del self.streams[tracker.token]
+            self.dirty.discard(tracker.token)
+        
+    def push(self, kind, token, value, change, mood=None, **data):
+        """Queue an event, replacing any queued event of the same kind for `token`"""
+        now = time.time()
+        self.queue = [item for item in self.queue if (item[3]['kind'], item[3]['token']) != (kind, token)]
+        heapq.heapify(self.queue)
+        event = dict(kind=kind, token=token, value=value, change=change,
+                     mood=mood or self.signals.mood(change), time=now, **data)
+        heapq.heappush(self.queue, (self.priorities[kind], now, self.seq, event))
+        self.seq += 1
+        metrics.inc("events_total", kind=kind)
+        if self.wakeup:
+            self.wakeup.set()
+        
+    def on_trade(self, mint, timestamp, market_cap_sol, sol_amount, largest):
+        """Connection listener, runs for every routed trade or coalesced update"""
+        tracker = self.streams.get(mint)
+        if tracker is None:
+            return
+        self.dirty.add(mint)
+        
+        if market_cap_sol >= tracker.migration_cap and mint not in self.migrated:
+            self.migrated.add(mint)
+            change, _, _ = tracker.buffer.window(tracker.check_interval, timestamp)
+            self.push('migration', mint, market_cap_sol, change)
+        elif largest >= self.large_trade_sol:
+            # A burst of small trades coalesced into one update is not a large trade
+            if timestamp - self.last_large_trade.get(mint, 0) >= self.large_trade_cooldown:
+                self.last_large_trade[mint] = timestamp
+                change, _, _ = tracker.buffer.window(tracker.check_interval, timestamp)
+                self.push('large_trade', mint, market_cap_sol, change, sol_amount=largest)
+                
+    def evaluate(self, samples):
+        """Feed {token: (value, change)} to the signal engine, queueing mood changes"""
+        if not samples:
+            return
+        tokens = list(samples)
+        changes = [samples[token][1] for token in tokens]
+        with metrics.timer("classify"):
+            events = self.signals.update_many(tokens, changes)
+        for token, mood in events:
+            value, change = samples[token]
+            self.push('mood_change', token, value, change, mood)
+            
+    def sample_trades(self):
+        """Windowed change for every token that traded since the last tick"""
+        samples = {}
+        for token in self.dirty:
+            tracker = self.streams.get(token)
+            if tracker is not None:
+                timestamp, market_cap_sol = tracker.buffer.latest()
+                change, _, _ = tracker.buffer.window(tracker.check_interval)
+                samples[token] = (float(market_cap_sol), change)
+        self.dirty.clear()
+        return samples
+        
+    async def sample_all(self):
+        """Heartbeat: poll every tracker regardless of activity"""
+        trackers = list(self.trackers.values())
+        results = await asyncio.gather(*(tracker.get_price() for tracker in trackers), return_exceptions=True)
+        return {tracker.token: result for tracker, result in zip(trackers, results)
+                if isinstance(result, tuple) and result[0] is not None}
+                
+    async def dispatch(self):
+        """Start queued events in priority order while the budget allows"""
+        now = time.time()
+        waiting = []
+        while self.queue:
+            item = heapq.heappop(self.queue)
+            priority, queued_at, _, event = item
+            if priority > 0 and now - queued_at > self.max_age:
+                self.dropped += 1
+                metrics.inc("events_dropped_total", kind=event['kind'])
+                log(f"Dropped stale {event['kind']} event for {event['token']}", level="warning")
+                continue
+            handler = self.handlers.get(event['token'])
+            if handler is None:
+                continue  # Token no longer watched
+            handle, posts = handler
+            # Migrations always go out, other posts wait for budget, local-only events never spend it
+            if priority > 0 and posts(event) and not self.budget.spend(now):
+                waiting.append(item)
+                continue
+            metrics.observe("event_queue", now - queued_at)
+            task = asyncio.create_task(handle(event))
+            self.inflight.add(task)
+            task.add_done_callback(self.inflight.discard)
+        for item in waiting:
+            heapq.heappush(self.queue, item)
+            
+    async def run(self):
+        """Evaluate trades every tick, sample on heartbeats and dispatch events"""
+        while True:
+            try:
+                # Heartbeat polls run in the background so slow APIs never delay trade events
+                if self.heartbeat_task and self.heartbeat_task.done():
+                    self.evaluate(self.heartbeat_task.result())
+                    self.heartbeat_task = None
+                if self.heartbeat_task is None and time.time() - self.last_heartbeat >= self.heartbeat:
+                    self.last_heartbeat = time.time()
+                    self.heartbeat_task = asyncio.create_task(self.sample_all())
+                self.evaluate(self.sample_trades())
+                await self.dispatch()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log(f"Scheduler error: {e}", level="error")
+                
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.tick)
+            except asyncio.TimeoutError:
+                pass
+
+class PostQueue:
+    """Durable outbox of generated posts drained by a bounded worker pool"""
+    permanent_errors = (tweepy.BadRequest, tweepy.Unauthorized, tweepy.Forbidden, tweepy.NotFound)
+    
+    def __init__(self, send, conn, on_sent=None, workers=2, max_attempts=6,
+                 base_delay=5, max_delay=900):
+        self.send = send              # async (text, image) -> None, raises on failure
+        self.conn = conn
+        self.on_sent = on_sent        # called with the row dict after a successful post
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.paused_until = 0         # Set from Twitter rate-limit headers
+        self.tasks = []
+        self.wakeup = None
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS outbox ("
+                "id INTEGER PRIMARY KEY, dedupe TEXT UNIQUE, token TEXT, mood TEXT, text TEXT, image TEXT, "
+                "status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, next_attempt REAL NOT NULL, "
+                "created REAL NOT NULL, error TEXT)"
+            )
+            # Posts claimed by a process that died are sent again
+            self.conn.execute("UPDATE outbox SET status = 'pending' WHERE status = 'sending'")
+            
+    @staticmethod
+    def dedupe_key(token, text):
+        normalized = ' '.join(''.join(c if c.isalnum() else ' ' for c in text.lower()).split())
+        return hashlib.sha256(f"{token}:{normalized}".encode()).hexdigest()
+        
+    def enqueue(self, token, mood, text, image):
+        """Queue a post, returning False if the same tweet was already queued or sent"""
+        now = time.time()
+        with self.conn:
+            cursor = self.conn.execute(
+                "INSERT OR IGNORE INTO outbox (dedupe, token, mood, text, image, status, next_attempt, created) "
+                "VALUES (?, ?, ?, ?, ?, 'pending', ?, ?)",
+                (self.dedupe_key(token, text), token, mood, text, image, now, now)
+            )
+        if cursor.rowcount == 0:
+            log("Duplicate post skipped", level="warning")
+            return False
+        self.start()
+        self.wakeup.set()
+        return True
+        
+    def images(self):
+        """Images referenced by posts that are not sent yet"""
+        return [row[0] for row in self.conn.execute(
+            "SELECT image FROM outbox WHERE status IN ('pending', 'sending')"
+        )]
+        
+    def pending(self):
+        """Number of posts waiting to be sent"""
+        return self.conn.execute("SELECT COUNT(*) FROM outbox WHERE status IN ('pending', 'sending')").fetchone()[0]
+        
+    def claim(self, now):
+        """Mark the oldest due post as sending and return it"""
+        with self.conn:
+            row = self.conn.execute(
+                "SELECT id, token, mood, text, image, attempts, created FROM outbox "
+                "WHERE status = 'pending' AND next_attempt <= ? ORDER BY next_attempt, id LIMIT 1", (now,)
+            ).fetchone()
+            if row is None:
+                return None
+            metrics.observe("outbox_wait", max(0.0, now - row[6]))
+            claimed = self.conn.execute(
+                "UPDATE outbox SET status = 'sending' WHERE id = ? AND status = 'pending'", (row[0],)
+            ).rowcount
+        if not claimed:
+            return None  # Another worker got there first
+        return dict(zip(('id', 'token', 'mood', 'text', 'image', 'attempts'), row))
+        
+    def finish(self, post, status, error=None, next_attempt=None, attempts=None):
+        with self.conn:
+            self.conn.execute(
+                "UPDATE outbox SET status = ?, error = ?, next_attempt = COALESCE(?, next_attempt), "
+                "attempts = COALESCE(?, attempts) WHERE id = ?",
+                (status, error, next_attempt, attempts, post['id'])
+            )
+            
+    def rate_limit_reset(self, error):
+        """Latest reset time among exhausted limits in a 429 response"""
+        headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+        resets = [float(headers[f"{prefix}-reset"]) for prefix in ('x-rate-limit', 'x-user-limit-24hour', 'x-app-limit-24hour')
+                  if headers.get(f"{prefix}-reset") and headers.get(f"{prefix}-remaining", "0") == "0"]
+        return max(resets) if resets else time.time() + 60
+        
+    async def attempt(self, post):
+        """Send one claimed post and record the outcome"""
+        try:
+            with metrics.timer("post_total"):
+                await self.send(post['text'], post['image'])
+            
+        except tweepy.TooManyRequests as e:
+            metrics.inc("posts_total", status="rate_limited")
+            # Rate limited, pause every worker until the window resets without burning an attempt
+            self.paused_until = max(self.paused_until, self.rate_limit_reset(e) + 1)
+            log(f"Twitter rate limit hit, pausing posts for {self.paused_until - time.time():.0f}s", level="warning")
+            self.finish(post, 'pending', str(e), next_attempt=self.paused_until)
+            return
+            
+        except Exception as e:
+            attempts = post['attempts'] + 1
+            metrics.inc("posts_total", status="error")
+            if isinstance(e, self.permanent_errors) or attempts >= self.max_attempts:
+                log(f"Post {post['id']} failed permanently: {e}", level="error")
+                self.finish(post, 'failed', str(e), attempts=attempts)
+                return
+            # Exponential backoff with full jitter
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempts))
+            log(f"Post {post['id']} failed ({e}), retrying in {delay:.0f}s", level="error")
+            self.finish(post, 'pending', str(e), next_attempt=time.time() + delay, attempts=attempts)
+            return
+            
+        self.finish(post, 'sent', attempts=post['attempts'] + 1)
+        metrics.inc("posts_total", status="sent")
+        if self.on_sent:
+            self.on_sent(post)
+            
+    async def worker(self):
+        while True:
+            now = time.time()
+            post = self.claim(now) if now >= self.paused_until else None
+            if post:
+                await self.attempt(post)
+                continue
+                
+            # Sleep until the next post is due or a new one arrives
+            row = self.conn.execute("SELECT MIN(next_attempt) FROM outbox WHERE status = 'pending'").fetchone()
+            due = max(row[0] or now + 60, self.paused_until)
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), max(0.05, min(due - now, 60)))
+            except asyncio.TimeoutError:
+                pass
+                
+    def start(self):
+        """Start the worker pool on the running event loop"""
+        if self.tasks and not all(task.done() for task in self.tasks):
+            return
+        self.wakeup = asyncio.Event()
+        self.tasks = [asyncio.create_task(self.worker()) for _ in range(self.workers)]
+        
+    async def drain(self, timeout=120):
+        """Wait for posts that are due now, leaving later retries for the next run"""
+        self.start()
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            row = self.conn.execute(
+                "SELECT COUNT(*) FROM outbox WHERE status = 'sending' OR (status = 'pending' AND next_attempt <= ?)",
+                (time.time(),)
+            ).fetchone()
+            if row[0] == 0 or time.time() < self.paused_until:
+                return
+            await asyncio.sleep(0.1)
+            
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+class PhaseManager:
+    """Runs Phase 1 and Phase 2 side by side across the migration with one stitched history"""
+    change_window = 3600  # Seconds, the span of DexScreener's h1 change
+    
+    def __init__(self, bot, warmup_ratio=0.85, interval=30, overlap=1800):
+        self.bot = bot
+        self.phase1 = bot.phase1_tracker
+        self.phase2 = bot.phase2_tracker
+        self.warmup_cap = self.phase1.migration_cap * warmup_ratio
+        self.interval = interval      # Seconds between Phase 2 samples once warming
+        self.overlap = overlap        # Seconds Phase 1 keeps streaming after the handoff
+        self.key = f"{self.phase1.token}.stitched"
+        saved = bot.state.get(self.state_key, {})
+        self.scale = saved.get('scale')               # Phase 1 market cap per Phase 2 price unit
+        self.migrated_at = saved.get('migrated_at')
+        self.warming = bot.phase == 2
+        self.retired = False
+        self.task = None
+        self.wakeup = asyncio.Event()
+        
+    @property
+    def state_key(self):
+        return f"phases:{self.phase1.token}"
+        
+    def save(self):
+        self.bot.state.set(self.state_key, {'scale': self.scale, 'migrated_at': self.migrated_at})
+        
+    def on_trade(self, mint, timestamp, market_cap_sol, sol_amount, largest):
+        """Connection listener feeding Phase 1 trades into the stitched series"""
+        if mint != self.phase1.token:
+            return
+        if self.migrated_at is None:
+            self.bot.series.append(self.key, timestamp, market_cap_sol, sol_amount)
+        if market_cap_sol >= self.warmup_cap and not self.warming:
+            log(f"Market cap {market_cap_sol:.2f} SOL is near migration, warming up Phase 2...")
+            self.warming = True
+            self.wakeup.set()
+            
+    def record_phase2(self, price):
+        """Calibrate against Phase 1 before the handoff and extend the stitched series after it"""
+        now = time.time()
+        _, market_cap_sol = self.phase1.buffer.latest()
+        if self.migrated_at is None:
+            if market_cap_sol:
+                self.scale = float(market_cap_sol) / price
+        elif self.scale:
+            self.bot.series.append(self.key, now, price * self.scale, 0.0)
+            
+    async def sample_phase2(self):
+        """Poll Phase 2 once, feeding the stitched series and the scheduler after the handoff"""
+        price, change = await self.phase2.get_price()
+        if price is None:
+            return
+        self.record_phase2(price)
+        if self.bot.phase == 2:
+            # A fresh pair's h1 change misses the run-up, the stitched history spans both phases
+            stitched, observations, _ = self.stitched(self.change_window)
+            if observations:
+                change = stitched
+            self.bot.scheduler.evaluate({self.phase2.token: (price, change)})
+            
+    def migrate(self):
+        """Mark the handoff, Phase 2 is already warm if the threshold was approached normally"""
+        if self.migrated_at is None:
+            if self.scale is None and self.phase2.last_price:
+                self.record_phase2(self.phase2.last_price)
+            self.migrated_at = time.time()
+            self.save()
+        self.warming = True
+        self.wakeup.set()
+        
+    def stitched(self, seconds):
+        """Change over the last `seconds` of the continuous Phase 1 + Phase 2 history"""
+        return self.bot.series.window(self.key, seconds)
+        
+    async def run(self):
+        """Warm Phase 2 near the threshold, keep it sampled and retire Phase 1 after the overlap"""
+        while True:
+            try:
+                if self.warming:
+                    await self.sample_phase2()
+                if (self.migrated_at and not self.retired
+                        and time.time() - self.migrated_at >= self.overlap):
+                    log("Migration overlap finished, stopping Phase 1 stream")
+                    await self.phase1.stop()
+                    self.retired = True
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log(f"Phase manager error: {e}", level="error")
+                
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            
+    def start(self):
+        self.phase1.connection.listeners.add(self.on_trade)
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+        return self.task
+        
+    async def stop(self):
+        self.phase1.connection.listeners.discard(self.on_trade)
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+class HashRing:
+    """Consistent hash ring assigning tokens to workers"""
+    def __init__(self, nodes=(), replicas=160):
+        self.replicas = replicas
+        self.hashes = []    # sorted virtual node hashes
+        self.owners = {}    # virtual node hash -> node
+        for node in nodes:
+            self.add(node)
+            
+    @staticmethod
+    def hash(key):
+        return int.from_bytes(hashlib.md5(str(key).encode()).digest()[:8], 'big')
+        
+    def add(self, node):
+        for i in range(self.replicas):
+            h = self.hash(f"{node}#{i}")
+            self.owners[h] = node
+            bisect.insort(self.hashes, h)
+            
+    def remove(self, node):
+        self.hashes = [h for h in self.hashes if self.owners[h] != node]
+        self.owners = {h: self.owners[h] for h in self.hashes}
+        
+    def node_for(self, key):
+        """Worker owning `key`, the first virtual node clockwise from its hash"""
+        if not self.hashes:
+            return None
+        i = bisect.bisect(self.hashes, self.hash(key)) % len(self.hashes)
+        return self.owners[self.hashes[i]]
+
+class ShardWorker:
+    """Runs the bots for one shard inside a worker process"""
+    def __init__(self, worker_id, inbox, reports, data_dir="shards", report_interval=5):
+        self.worker_id = worker_id
+        self.inbox = inbox            # supervisor -> worker commands
+        self.reports = reports        # worker -> supervisor health and metrics
+        self.data_dir = data_dir
+        self.report_interval = report_interval
+        self.bots = {}                # phase1 token -> (MemeBot, task)
+        self.seq = -1                 # Last assignment applied
+        self.loop_lag = 0.0
+        
+    async def release(self, token):
+        """Stop the bot for `token`, it stays listed as owned until fully closed"""
+        bot, task = self.bots[token]
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        del self.bots[token]
+        log(f"[worker {self.worker_id}] released {token}")
+        
+    async def assign(self, pairs, seq=None):
+        """Start bots for newly owned tokens and stop the ones moved elsewhere"""
+        wanted = {phase1: phase2 for phase1, phase2 in pairs}
+        await asyncio.gather(*(self.release(token) for token in list(self.bots) if token not in wanted))
+        for token, phase2 in wanted.items():
+            if token not in self.bots:
+                bot = MemeBot(token, phase2, data_dir=os.path.join(self.data_dir, token))
+                self.bots[token] = (bot, asyncio.create_task(bot.run_and_close(bot.run())))
+                log(f"[worker {self.worker_id}] tracking {token}")
+        if seq is not None:
+            # Acknowledge right away so the supervisor can hand released tokens on
+            self.seq = seq
+            self.reports.put(self.health())
+            
+    def health(self):
+        connection = PumpPortalConnection.shared()
+        return {
+            'worker': self.worker_id,
+            'pid': os.getpid(),
+            'time': time.time(),
+            'seq': self.seq,
+            'tokens': list(self.bots),
+            'trades': sum(buffer.count for buffer in connection.buffers.values()),
+            'pending_posts': sum(bot.outbox.pending() for bot, task in self.bots.values() if not task.done()),
+            'loop_lag_ms': self.loop_lag * 1000,
+            'rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        }
+        
+    async def report(self):
+        """Measure event loop lag and send health to the supervisor"""
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.report_interval)
+            self.loop_lag = max(0.0, time.perf_counter() - start - self.report_interval)
+            self.reports.put(self.health())
+            
+    async def run(self):
+        reporter = asyncio.create_task(self.report())
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                command = await loop.run_in_executor(None, self.inbox.get)
+                if command['cmd'] == 'assign':
+                    if 'tweets_per_day' in command:
+                        # All workers post with the same credentials, each gets its slice of the day
+                        Scheduler.shared().budget.resize(command['tweets_per_day'], command['burst'])
+                    await self.assign(command['tokens'], command.get('seq'))
+                elif command['cmd'] == 'stop':
+                    break
+        finally:
+            await self.assign([])
+            reporter.cancel()
+
+def run_shard_worker(worker_id, inbox, reports, data_dir):
+    """Process entry point for a shard worker"""
+    asyncio.run(ShardWorker(worker_id, inbox, reports, data_dir).run())
+
+class ShardSupervisor:
+    """Splits token pairs across worker processes by consistent hashing"""
+    def __init__(self, pairs, workers=None, data_dir="shards", health_timeout=30, print_interval=30,
+                 per_day=None, burst=3):
+        self.pairs = list(pairs)                  # [(phase1 token, phase2 token)]
+        self.per_day = float(os.getenv("TWEETS_PER_DAY", "17")) if per_day is None else per_day
+        self.burst = burst
+        self.worker_count = workers or os.cpu_count() or 1
+        self.data_dir = data_dir
+        self.health_timeout = health_timeout
+        self.print_interval = print_interval
+        self.context = multiprocessing.get_context("spawn")
+        self.reports = self.context.Queue()
+        self.workers = {}                         # worker id -> (process, inbox)
+        self.health = {}                          # worker id -> latest report
+        self.ring = HashRing()
+        self.next_id = 0
+        self.desired = {}                         # worker id -> [pairs] it should own
+        self.sent = {}                            # worker id -> (tokens, budget) in its last assignment
+        self.unacked = {}                         # worker id -> {seq: tokens} not yet applied
+        self.seq = 0
+        
+    def spawn(self):
+        """Start a worker process and add it to the ring"""
+        worker_id = self.next_id
+        self.next_id += 1
+        inbox = self.context.Queue()
+        process = self.context.Process(
+            target=run_shard_worker, args=(worker_id, inbox, self.reports, self.data_dir), daemon=True
+        )
+        process.start()
+        self.workers[worker_id] = (process, inbox)
+        self.health[worker_id] = {'time': time.time()}
+        self.ring.add(worker_id)
+        return worker_id
+        
+    def retire(self, worker_id):
+        """Drop a worker from the ring, stopping its process"""
+        process, inbox = self.workers.pop(worker_id)
+        self.health.pop(worker_id, None)
+        self.sent.pop(worker_id, None)
+        self.unacked.pop(worker_id, None)
+        self.ring.remove(worker_id)
+        if process.is_alive():
+            inbox.put({'cmd': 'stop'})
+            process.join(10)
+            if process.is_alive():
+                process.terminate()
+                
+    def assignments(self):
+        owned = {worker_id: [] for worker_id in self.workers}
+        for pair in self.pairs:
+            owned[self.ring.node_for(pair[0])].append(pair)
+        return owned
+        
+    def rebalance(self):
+        """Recompute every worker's share, only moved tokens restart"""
+        self.desired = self.assignments()
+        log(f"Assigned {len(self.pairs)} token(s) across {len(self.workers)} worker(s)")
+        self.handover()
+        
+    def held(self, worker_id):
+        """Tokens `worker_id` may still be running: reported ones plus any it has yet to apply"""
+        report = self.health.get(worker_id, {})
+        tokens = set(report.get('tokens', []))
+        for seq, sent in self.unacked.get(worker_id, {}).items():
+            if seq > report.get('seq', -1):
+                tokens |= sent
+        return tokens
+        
+    def budget(self, pairs):
+        """Posting allowance for a worker owning `pairs`, proportional to its share of tokens"""
+        share = len(pairs) / max(1, len(self.pairs))
+        return self.per_day * share, max(1, self.burst * share) if pairs else 0
+        
+    def handover(self):
+        """Send each worker its share, holding back tokens another worker has not released yet"""
+        # Two processes on one token would share its series files, state and outbox
+        for worker_id, pairs in self.desired.items():
+            if worker_id not in self.workers:
+                continue
+            busy = set().union(*(self.held(other) for other in self.workers if other != worker_id))
+            allowed = [pair for pair in pairs if pair[0] not in busy]
+            tokens = frozenset(pair[0] for pair in allowed)
+            per_day, burst = self.budget(pairs)
+            if self.sent.get(worker_id) == (tokens, per_day):
+                continue
+            self.seq += 1
+            self.sent[worker_id] = (tokens, per_day)
+            self.unacked.setdefault(worker_id, {})[self.seq] = tokens
+            self.workers[worker_id][1].put({
+                'cmd': 'assign', 'tokens': allowed, 'seq': self.seq,
+                'tweets_per_day': per_day, 'burst': burst
+            })
+            
+    def collect(self, timeout=1.0):
+        """Drain worker reports"""
+        try:
+            while True:
+                report = self.reports.get(timeout=timeout)
+                if report['worker'] in self.workers:
+                    self.health[report['worker']] = report
+                    unacked = self.unacked.get(report['worker'], {})
+                    for seq in [s for s in unacked if s <= report.get('seq', -1)]:
+                        del unacked[seq]
+                timeout = 0
+        except queue.Empty:
+            pass
+            
+    def check_workers(self):
+        """Replace dead or silent workers and rebalance"""
+        now = time.time()
+        failed = [worker_id for worker_id, (process, _) in self.workers.items()
+                  if not process.is_alive() or now - self.health[worker_id]['time'] > self.health_timeout]
+        for worker_id in failed:
+            log(f"Worker {worker_id} is unhealthy, replacing it", level="error")
+            self.retire(worker_id)
+            self.spawn()
+        if failed:
+            self.rebalance()
+            
+    def metrics(self):
+        """Aggregate the latest health reports"""
+        reports = [r for r in self.health.values() if 'tokens' in r]
+        return {
+            'workers': len(self.workers),
+            'tokens': sum(len(r['tokens']) for r in reports),
+            'trades': sum(r['trades'] for r in reports),
+            'pending_posts': sum(r['pending_posts'] for r in reports),
+            'max_loop_lag_ms': max((r['loop_lag_ms'] for r in reports), default=0.0),
+            'rss_mb': sum(r['rss_mb'] for r in reports)
+        }
+        
+    def run(self):
+        """Supervise workers until interrupted"""
+        for _ in range(self.worker_count):
+            self.spawn()
+        self.rebalance()
+        last_print = time.time()
+        try:
+            while True:
+                self.collect()
+                self.check_workers()
+                self.handover()
+                if time.time() - last_print >= self.print_interval:
+                    last_print = time.time()
+                    log(f"Shard metrics: {json.dumps(self.metrics())}")
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for worker_id in list(self.workers):
+                self.retire(worker_id)
+
+class Replay:
+    """Backtest of posting decisions over a recorded trade log, nothing is generated or posted"""
+    priorities = Scheduler.priorities
+    
+    def __init__(self, timestamps, market_caps, sol_amounts=None, window=300, tick=1.0,
+                 migration_cap=None, large_trade_sol=None, large_trade_cooldown=600):
+        order = np.argsort(timestamps, kind='stable')
+        self.timestamps = np.asarray(timestamps, dtype=np.float64)[order]
+        self.market_caps = np.asarray(market_caps, dtype=np.float64)[order]
+        self.sol_amounts = None if sol_amounts is None else np.asarray(sol_amounts, dtype=np.float64)[order]
+        self.window = window
+        self.migration_cap = migration_cap
+        self.large_trade_sol = large_trade_sol
+        self.large_trade_cooldown = large_trade_cooldown
+        
+        # Trade events are the same for every mood config
+        self.migrated_at = None
+        self.trade_events = []
+        if migration_cap is not None:
+            crossed = np.flatnonzero(self.market_caps >= migration_cap)
+            if len(crossed):
+                i = int(crossed[0])
+                self.migrated_at = self.timestamps[i]
+                self.trade_events.append((self.migrated_at, 'migration', self.market_caps[i], i))
+        if large_trade_sol is not None and self.sol_amounts is not None:
+            self.trade_events += self.large_trades()
+            
+        # The scheduler evaluates every token that traded once per tick, until it migrates
+        ticks = np.unique((np.floor(self.timestamps / tick) + 1) * tick)
+        if self.migrated_at is not None:
+            ticks = ticks[ticks <= self.migrated_at]
+        self.times = ticks
+        self.changes = self.changes_at(ticks, side='left')
+        
+    @classmethod
+    def load(cls, path, mint=None, **kwargs):
+        """Replay a JSONL trade log or a SeriesStore key directory"""
+        if os.path.isdir(path):
+            directory, key = os.path.split(os.path.normpath(path))
+            timestamps, values, _ = SeriesStore(directory).read(key)
+            return cls(np.array(timestamps), np.array(values), **kwargs)
+        timestamps, market_caps, sol_amounts, mint = cls.read_jsonl(path, mint)
+        log(f"Loaded {len(timestamps)} trades for {mint}")
+        kwargs.setdefault('migration_cap', PumpFunTracker.migration_cap)
+        kwargs.setdefault('large_trade_sol', float(os.getenv("LARGE_TRADE_SOL", "5")))
+        return cls(timestamps, market_caps, sol_amounts, **kwargs)
+        
+    @staticmethod
+    def read_jsonl(path, mint=None):
+        """Columns for `mint`, or the most traded mint, from timestamped PumpPortal messages"""
+        loads = orjson.loads if orjson else json.loads
+        mints = {}
+        codes, timestamps, market_caps, sol_amounts = [], [], [], []
+        with open(path, "rb") as f:
+            for n, line in enumerate(f):
+                try:
+                    data = loads(line)
+                    market_cap = float(data['marketCapSol'])
+                except (ValueError, KeyError, TypeError):
+                    continue  # Subscription acks and torn lines
+                timestamp = data.get('timestamp', data.get('ts'))
+                if timestamp is None:
+                    # Windows and dwell times are in seconds, line numbers would silently distort them
+                    raise ValueError(
+                        f"{path}:{n + 1} has no 'timestamp' or 'ts' field. Raw PumpPortal messages carry "
+                        f"no time, record them with a unix timestamp or replay a series/<mint> directory"
+                    )
+                codes.append(mints.setdefault(data.get('mint'), len(mints)))
+                timestamps.append(timestamp)
+                market_caps.append(market_cap)
+                sol_amounts.append(data.get('solAmount') or 0.0)
+        if not codes:
+            raise ValueError(f"No trades in {path}")
+        codes = np.array(codes)
+        if mint is None:
+            mint = max(mints, key=lambda m: np.count_nonzero(codes == mints[m]))
+        rows = codes == mints.get(mint, -1)
+        timestamps = np.array(timestamps, dtype=np.float64)[rows]
+        if len(timestamps) and timestamps.max() > 1e11:
+            timestamps /= 1000  # Millisecond timestamps
+        return (timestamps, np.array(market_caps, dtype=np.float64)[rows],
+                np.array(sol_amounts, dtype=np.float64)[rows], mint)
+        
+    def changes_at(self, times, side='right'):
+        """TradeBuffer.window change at every time in `times` in one pass"""
+        last = np.searchsorted(self.timestamps, times, side=side) - 1
+        start = np.searchsorted(self.timestamps, times - self.window, side='left')
+        reference = self.market_caps[np.maximum(start - 1, 0)]
+        current = self.market_caps[np.maximum(last, 0)]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            changes = np.where(reference != 0, (current - reference) / reference * 100, 0.0)
+        return changes
+        
+    def large_trades(self):
+        """Large-trade events honouring the cooldown, as Scheduler.on_trade emits them"""
+        candidates = np.flatnonzero(self.sol_amounts >= self.large_trade_sol)
+        if self.migrated_at is not None:
+            candidates = candidates[self.timestamps[candidates] < self.migrated_at]
+        times = self.timestamps[candidates]
+        events, k = [], 0
+        while k < len(candidates):
+            i = int(candidates[k])
+            events.append((times[k], 'large_trade', self.market_caps[i], i))
+            k = int(np.searchsorted(times, times[k] + self.large_trade_cooldown, side='left'))
+        return events
+        
+    def run(self, hysteresis=2.0, min_dwell=600, per_day=17, burst=3, max_age=300):
+        """Posts one config would have made: [(time, kind, mood, change)] plus the events it dropped"""
+        signals = SignalEngine(hysteresis=hysteresis, min_dwell=min_dwell)
+        events = [(self.times[i], 'mood_change', mood, self.changes[i])
+                  for i, mood in signals.replay(self.times, self.changes)]
+        if self.trade_events:
+            trade_changes = self.changes_at(self.timestamps[[i for *_, i in self.trade_events]])
+            events += [(t, kind, signals.mood(change), change)
+                       for (t, kind, _, _), change in zip(self.trade_events, trade_changes)]
+        events.sort(key=lambda event: (event[0], self.priorities[event[1]]))
+        
+        budget = PostBudget(per_day=per_day, burst=burst)
+        budget.updated = events[0][0] if events else 0.0
+        posts, queue, dropped = [], {}, 0
+        
+        def dispatch(until):
+            # Post queued events in priority order whenever the budget has refilled
+            nonlocal dropped
+            while queue:
+                kind = min(queue, key=self.priorities.get)
+                queued = queue[kind]
+                if kind == 'migration':
+                    ready = queued[0]
+                elif budget.tokens >= 1:
+                    ready = max(queued[0], budget.updated)
+                elif budget.rate > 0:
+                    ready = max(queued[0], budget.updated + (1 - budget.tokens) / budget.rate)
+                else:
+                    ready = np.inf
+                if ready > until:
+                    return
+                del queue[kind]
+                if kind != 'migration':
+                    if ready - queued[0] > max_age:
+                        dropped += 1
+                        continue
+                    budget.refill(ready)
+                    budget.tokens = max(budget.tokens, 1.0) - 1
+                posts.append((ready,) + queued[1:])
+                
+        for event in events:
+            dispatch(event[0])
+            queue[event[1]] = event  # A newer event replaces a queued one of the same kind
+            dispatch(event[0])
+        dispatch(np.inf)
+        return posts, dropped
+
 class MemeBot:
-    def __init__(self):
+    metrics_server = None  # One metrics endpoint per process
+    
+    def __init__(self, phase1_token=None, phase2_token=None, connection=None, data_dir="."):
         load_dotenv()
+        # Everything this bot persists lives under data_dir so bots can move between processes
+        self.data_dir = data_dir
+        os.makedirs(data_dir, exist_ok=True)
         self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.async_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.text_timeout = 30   # seconds
+        self.image_timeout = 90  # seconds
+        self.http = HttpPool(limit=20, timeout=60)
+        self.image_pool = ImagePool(self.generate_image_async, self.http, directory=self.path("image_pool"))
+        self.tweet_pool = TweetPool(self.generate_candidates, path=self.path("tweet_pool.json"))
+        self.image_processor = ImageProcessor.from_env(cache_dir=self.path("image_cache"))
         # Phase 1 token
-        self.phase1_token = "C5iW1qmzJ2JXJuJyaojWs2dCpEqcfVToouCuq9pvpump"
+        self.phase1_token = phase1_token or os.getenv("PHASE1_TOKEN", "C5iW1qmzJ2JXJuJyaojWs2dCpEqcfVToouCuq9pvpump")
         # Phase 2 token
-        self.phase2_token = "DgG9sM56ZcVidBV8bNArQPm93a2rmjzHkrrUntGSpump"
+        self.phase2_token = phase2_token or os.getenv("PHASE2_TOKEN", "DgG9sM56ZcVidBV8bNArQPm93a2rmjzHkrrUntGSpump")
         # Current token starts as Phase 1
         self.token = self.phase1_token
         self.token_symbol = "$IMPULS"
         
-        # Initialize trackers with respective tokens
-        self.phase1_tracker = PumpFunTracker(self.phase1_token)
-        self.phase2_tracker = DexScreenerTracker(self.phase2_token)
+        # Every observation is logged locally for arbitrary window queries
+        self.series = SeriesStore(os.getenv("SERIES_PATH", self.path("series")))
+        
+        # Initialize trackers with respective tokens, bots in one process share a socket
+        self.phase1_tracker = PumpFunTracker(self.phase1_token, connection)
+        self.phase1_tracker.connection.series[self.phase1_token] = self.series
+        self.phase2_tracker = DexScreenerTracker(self.phase2_token, series=self.series)
         self.current_tracker = None
         
+        # Last observations, phase and post survive one-shot runs
+        self.state = StateStore(os.getenv("STATE_PATH", self.path("bot_state.db")))
+        self.phase = 1
+        self.last_mood = None
+        self.last_post_time = None
+        self.moods = {}  # token -> [last posted mood, post time]
+        
+        # Moods only change once a move clears a threshold and the last mood has settled
+        self.signals = SignalEngine.shared()
+        
+        # Posts are queued durably and sent by background workers
+        self.outbox = PostQueue(self.send_tweet, self.state.conn, on_sent=self.on_posted)
+        metrics.gauge("outbox_depth", self.outbox.pending, token=self.phase1_token)
+        self.image_pool.in_use = self.outbox.images
+        self.load_state()
+        
         # Twitter setup
         self.twitter_client = tweepy.Client(
             consumer_key=os.getenv("TWITTER_API_KEY"),
@@ -173,26 +2265,10 @@ class MemeBot:
 
     def get_personality_mode(self, price_change):
         """Get personality modes based on key price movement thresholds"""
-        if price_change > 100:    # Gigabullish (laser eyes, explosions)
-            return 'gigabullish'
-        elif price_change > 50:   # Bullish (floating, victory)
-            return 'bullish'
-        elif price_change > 10:   # Cookin (confident glow)
-            return 'cookin'
-        elif price_change > 0:    # Optimistic (slight smile)
-            return 'optimistic'
-        elif price_change > -10:  # This is fine (slight worry)
-            return 'this_is_fine'
-        elif price_change > -50:  # Worried (visible stress)
-            return 'worried'
-        elif price_change > -100: # Max cope (breaking down)
-            return 'max_cope'
-        else:                     # It's over (melting/shattered)
-            return 'its_over'
+        return self.signals.mood(price_change)
 
-    def generate_response(self, price_change):
-        """Generate tweet text based on price change"""
-        mode = self.get_personality_mode(price_change)
+    def text_request(self, mode, n=1):
+        """Chat completion arguments for `n` tweets in personality `mode`"""
         prompt = f"""
         You are $IMPULS, an AI token on Solana. This is your identity:
         
@@ -213,8 +2289,8 @@ class MemeBot:
         Generate a single tweet expressing your current emotional state.
         Do not use any quotation marks in your response.
         """
-            
-        response = self.client.chat.completions.create(
+        
+        return dict(
             model="gpt-4",
             messages=[{
                 "role": "system",
@@ -225,15 +2301,28 @@ class MemeBot:
                 "content": prompt
             }],
             max_tokens=100,
-            temperature=0.9
+            temperature=0.9,
+            n=n
         )
+
+    def generate_response(self, price_change):
+        """Generate tweet text based on price change"""
+        mode = self.get_personality_mode(price_change)
+        response = self.client.chat.completions.create(**self.text_request(mode))
         
         # Strip any quotes and extra whitespace
         tweet_text = response.choices[0].message.content.strip().strip('"\'').strip()
         return tweet_text
 
-    def generate_image(self, mood):
-        """Generate image based on mood"""
+    async def generate_candidates(self, mode, n):
+        """Generate `n` tweet candidates for `mode` in a single request"""
+        metrics.inc("api_calls_total", api="openai_chat")
+        with metrics.timer("text_gen"):
+            response = await self.async_client.chat.completions.create(**self.text_request(mode, n))
+        return [choice.message.content.strip().strip('"\'').strip() for choice in response.choices]
+
+    def image_prompt(self, mood):
+        """DALL-E prompt for `mood`"""
         base_character = """A hyper-realistic 3D octane render of an expressive cyborg trader, like a cyberpunk Wojak meme character. The character has dramatically exaggerated facial features with huge eyes that change color based on emotions, a partly transparent skull showing a glowing digital brain, and chrome mechanical arms with exposed neon circuitry. The character sits at a chaotic trading desk surrounded by floating holographic screens. The scene has a cinematic cyberpunk aesthetic with deep shadows and dramatic lighting."""
         
         # Color palette definition for each mood
@@ -266,75 +2355,187 @@ class MemeBot:
             'its_over': f"{base_character} TOTAL ANNIHILATION! [Intensity: -∞/10] Color scheme: {color_schemes['its_over']}. A dramatic and intense scene of a cyborg facing catastrophic destruction. The cyborg is breaking apart completely with molten red energy coursing through its frame as it sinks into a pit of lava. Mechanical parts are scattered across a shattered industrial environment, with sparks flying and fragments of machinery strewn about. Surrounding screens are flickering and sparking, with twisted metal and smoldering wreckage adding to the chaos. Emergency lights pulse through the haze of smoke and fire, creating a scene of utter devastation and technological collapse."
         }
         
+        return mood_prompts[mood]
+
+    def generate_image(self, mood):
+        """Generate image based on mood"""
         try:
             response = self.client.images.generate(
                 model="dall-e-3",
-                prompt=mood_prompts[mood],
+                prompt=self.image_prompt(mood),
                 size="1024x1024",
                 quality="standard",
                 n=1,
             )
             
             image_url = response.data[0].url
-            print(f"Image generated successfully: {image_url}")
+            log(f"Image generated successfully: {image_url}")
             return image_url
             
         except Exception as e:
-            print(f"Error generating image: {e}")
+            log(f"Error generating image: {e}", level="error")
             return None
 
-    async def post_tweet(self, tweet_text, image_url):
-        """Post tweet with image"""
+    async def generate_image_async(self, mood):
+        """Generate image without blocking the event loop"""
         try:
-            # Download image
-            image_response = requests.get(image_url)
-            if image_response.status_code != 200:
-                raise Exception("Failed to download image")
+            metrics.inc("api_calls_total", api="openai_image")
+            with metrics.timer("image_gen"):
+                response = await self.async_client.images.generate(
+                    model="dall-e-3",
+                    prompt=self.image_prompt(mood),
+                    size="1024x1024",
+                    quality="standard",
+                    n=1,
+                )
+            
+            image_url = response.data[0].url
+            log(f"Image generated successfully: {image_url}")
+            return image_url
+            
+        except Exception as e:
+            log(f"Error generating image: {e}", level="error")
+            return None
 
-            # Save image temporarily
-            temp_image = "temp_mood.png"
-            with open(temp_image, "wb") as f:
-                f.write(image_response.content)
+    async def generate_post(self, change, mood=None):
+        """Draw tweet text and an image from their pools, generating only on a miss"""
+        mood = mood or self.get_personality_mode(change)
+        tasks = [
+            asyncio.create_task(asyncio.wait_for(self.tweet_pool.draw(mood), self.text_timeout)),
+            asyncio.create_task(asyncio.wait_for(self.image_pool.acquire(mood), self.image_timeout))
+        ]
+        try:
+            results = await asyncio.gather(*tasks)
+        except BaseException:
+            # A failed or cancelled call makes the other result useless
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        return mood, results[0], results[1]
 
-            # Upload media to Twitter
-            media = self.twitter_api.media_upload(filename=temp_image)
-            
-            # Post tweet with media
-            self.twitter_client.create_tweet(
+    async def load_image(self, image):
+        """In-memory buffer holding a pool file or an image streamed from a URL"""
+        if os.path.exists(image):
+            with open(image, "rb") as f:
+                return io.BytesIO(f.read())
+        return await self.http.download(image)
+
+    async def send_tweet(self, tweet_text, image_url):
+        """Post tweet with image from a URL or a local pool file, raising on failure"""
+        with metrics.timer("download"):
+            image = await self.load_image(image_url)
+        filename = "mood.png"
+        if self.image_processor:
+            image, filename = await self.image_processor.process(image)
+        
+        # Upload media to Twitter off the event loop, no temp file involved
+        metrics.inc("api_calls_total", api="twitter_upload")
+        with metrics.timer("upload"):
+            media = await asyncio.to_thread(
+                self.twitter_api.media_upload,
+                filename=filename,
+                file=image,
+                chunked=True,
+                media_category="tweet_image"
+            )
+        
+        # Post tweet with media
+        metrics.inc("api_calls_total", api="twitter_post")
+        with metrics.timer("post"):
+            await asyncio.to_thread(
+                self.twitter_client.create_tweet,
                 text=tweet_text,
                 media_ids=[media.media_id]
             )
-            
-            # Clean up temp file
-            os.remove(temp_image)
-            
-            print("Tweet posted successfully!")
+        
+        log("Tweet posted successfully!")
+
+    async def post_tweet(self, tweet_text, image_url):
+        """Post tweet with image"""
+        try:
+            await self.send_tweet(tweet_text, image_url)
             return True
             
         except Exception as e:
-            print(f"Error posting tweet: {e}")
+            log(f"Error posting tweet: {e}", level="error")
             return False
 
-    async def handle_price_update(self, price, change, test_mode=False):
+    def path(self, name):
+        """Location of a persisted file for this bot"""
+        return os.path.join(self.data_dir, name)
+
+    @property
+    def token_key(self):
+        """Signal engine key for the token currently tracked"""
+        return self.phase2_token if self.phase == 2 else self.phase1_token
+
+    def load_state(self):
+        """Restore tracker observations and bot progress from the state store"""
+        for tracker in (self.phase1_tracker, self.phase2_tracker):
+            saved = self.state.get(tracker.state_key)
+            if saved:
+                tracker.restore(saved)
+        bot_state = self.state.get(f"bot:{self.phase1_token}", {})
+        self.phase = bot_state.get('phase', 1)
+        self.last_mood = bot_state.get('last_mood')
+        self.last_post_time = bot_state.get('last_post_time')
+        # Older state only kept one mood, it belongs to whichever token was tracked then
+        self.moods = bot_state.get('moods') or (
+            {self.token_key: [self.last_mood, self.last_post_time]} if self.last_mood else {}
+        )
+        for token, (mood, posted_at) in self.moods.items():
+            self.signals.seed(token, mood, posted_at)
+        
+    def save_state(self):
+        """Persist tracker observations and bot progress in one transaction"""
+        self.state.update({
+            self.phase1_tracker.state_key: self.phase1_tracker.snapshot(),
+            self.phase2_tracker.state_key: self.phase2_tracker.snapshot(),
+            f"bot:{self.phase1_token}": {
+                'phase': self.phase,
+                'last_mood': self.last_mood,
+                'last_post_time': self.last_post_time,
+                'moods': self.moods
+            }
+        })
+
+    def local_changes(self, token):
+        """Changes over standard windows and since the last post from the local series"""
+        windows = {'5m': 300, '1h': 3600, '24h': 86400}
+        changes = {name: self.series.window(token, seconds)[0] for name, seconds in windows.items()}
+        if self.last_post_time:
+            changes['since_post'] = self.series.since(token, self.last_post_time)[0]
+        return changes
+
+    def on_posted(self, post):
+        """Outbox callback once a queued post is live"""
+        self.tweet_pool.mark_posted(post['text'])
+        self.last_mood = post['mood']
+        self.last_post_time = time.time()
+        self.moods[post['token']] = [self.last_mood, self.last_post_time]
+        self.save_state()
+
+    async def handle_price_update(self, price, change, test_mode=False, mood=None, token=None):
         """Handle price update with tweet generation and posting"""
         try:
-            mood = self.get_personality_mode(change)
-            response = self.generate_response(change)
-            image_url = self.generate_image(mood)
+            mood, response, image_url = await self.generate_post(change, mood)
             
-            print(f"\nMood: {mood}")
-            print(f"Tweet: {response}")
-            print(f"Image URL: {image_url}")
+            log(f"\nMood: {mood}")
+            log(f"Tweet: {response}")
+            log(f"Image URL: {image_url}")
             
             if not test_mode and image_url:  # Only post to Twitter if not in test mode
-                await self.post_tweet(response, image_url)
+                self.outbox.enqueue(token or self.token_key, mood, response, image_url)
                 
+        except asyncio.TimeoutError:
+            log("Price update handling error: generation timed out", level="error")
         except Exception as e:
-            print(f"Price update handling error: {e}")
+            log(f"Price update handling error: {e}", level="error")
 
     async def run_phase1(self):
         """Run Phase 1 (PumpFun tracking)"""
-        print("Starting Phase 1 (PumpFun tracking)...")
+        log("Starting Phase 1 (PumpFun tracking)...")
         self.current_tracker = self.phase1_tracker
         
         while True:
@@ -343,22 +2544,29 @@ class MemeBot:
                 
                 if market_cap is not None:
                     # Check for phase migration
-                    if market_cap >= 420:
-                        print("\nReached 420 SOL market cap! Migrating to Phase 2 (DexScreener)...")
+                    if market_cap >= self.current_tracker.migration_cap:
+                        log(f"\nReached {self.current_tracker.migration_cap} SOL market cap! Migrating to Phase 2 (DexScreener)...")
+                        self.phase = 2
+                        self.save_state()
                         return True
                         
-                    # Generate and post tweet based on market cap change
-                    await self.handle_price_update(market_cap, change, test_mode=True)
+                    self.save_state()
+                    
+                    # Generate and post tweet only when the mood really changes
+                    mood = self.signals.update(self.phase1_token, change)
+                    if mood:
+                        await self.handle_price_update(market_cap, change, test_mode=True, mood=mood,
+                                                   token=self.phase1_token)
                     
                 await asyncio.sleep(self.current_tracker.check_interval)
                 
             except Exception as e:
-                print(f"Phase 1 error: {e}")
+                log(f"Phase 1 error: {e}", level="error")
                 await asyncio.sleep(60)
 
     async def run_phase2_once(self):
         """Run Phase 2 (DexScreener) once"""
-        print("Running single Phase 2 check...")
+        log("Running single Phase 2 check...")
         self.current_tracker = self.phase2_tracker
         self.token = self.phase2_token
         
@@ -366,32 +2574,116 @@ class MemeBot:
             price, change = await self.current_tracker.get_price()
             
             if price is not None:
-                print(f"\n=== Current Price: ${price:.6f} ===")
-                print(f"=== Price Change: {change:.2f}% ===\n")
+                self.save_state()
+                log(f"\n=== Current Price: ${price:.6f} ===")
+                log(f"=== Price Change: {change:.2f}% ===")
+                local = self.local_changes(self.phase2_token)
+                log("=== Local: " + " | ".join(f"{k}: {v:.2f}%" for k, v in local.items()) + " ===\n")
                 
-                # Generate and post tweet
-                await self.handle_price_update(price, change)
+                # Generate and post tweet only when the mood really changes
+                mood = self.signals.update(self.phase2_token, change)
+                if mood:
+                    await self.handle_price_update(price, change, mood=mood, token=self.phase2_token)
+                else:
+                    log(f"Mood unchanged ({self.moods.get(self.phase2_token, [None])[0]}), skipping post")
                 
         except Exception as e:
-            print(f"Phase 2 error: {e}")
+            log(f"Phase 2 error: {e}", level="error")
 
     async def run(self):
-        """Main bot run method"""
+        """Main bot run method, tracks Phase 1 then keeps tracking Phase 2 after migration"""
         try:
-            # Start with Phase 1
-            if await self.run_phase1():
-                # If Phase 1 completes (reaches 420 SOL), switch to Phase 2
-                await self.run_phase2_once()
-                
+            await self.run_events()
+            
         except Exception as e:
-            print(f"Bot run error: {e}")
+            log(f"Bot run error: {e}", level="error")
+            
+    def posts(self, event):
+        """Whether handling `event` posts to Twitter, Phase 1 posts stay local as in run_phase1"""
+        if event['kind'] == 'migration':
+            return True
+        return self.phase == 2 and event['token'] == self.phase2_token
+        
+    async def handle_event(self, event):
+        """Scheduler callback turning an event into a post"""
+        log(f"\n=== {event['kind']} event for {event['token']}: {event['mood']} ({event['change']:.2f}%) ===")
+        if event['kind'] == 'migration':
+            log(f"\nReached {self.phase1_tracker.migration_cap} SOL market cap! Migrating to Phase 2 (DexScreener)...")
+            self.phase = 2
+            self.phases.migrate()
+            # Phase 1 keeps streaming into the stitched history until the overlap ends
+            self.scheduler.unwatch(self.phase1_tracker)
+            self.scheduler.watch(self.phase2_tracker, self.handle_event, self.posts)
+            self.save_state()
+            
+        test_mode = not self.posts(event)
+        await self.handle_price_update(event['value'], event['change'], test_mode=test_mode,
+                                       mood=event['mood'], token=event['token'])
+        
+    async def run_events(self):
+        """Long-running event-driven mode reacting within seconds"""
+        log("Starting event-driven scheduler...")
+        self.phases = PhaseManager(
+            self,
+            warmup_ratio=float(os.getenv("PHASE2_WARMUP_RATIO", "0.85")),
+            overlap=float(os.getenv("PHASE_OVERLAP", "1800"))
+        )
+        # Every bot in the process shares one queue and one posting budget
+        self.scheduler = Scheduler.shared()
+        metrics.gauge("event_queue_depth", lambda: len(self.scheduler.queue))
+        if self.phase == 2:
+            self.scheduler.watch(self.phase2_tracker, self.handle_event, self.posts)
+        else:
+            await self.phase1_tracker.start()
+            self.scheduler.watch(self.phase1_tracker, self.handle_event, self.posts)
+        self.phases.start()
+        server = None
+        if os.getenv("METRICS_PORT") and not self.__class__.metrics_server:
+            server = await metrics.serve(os.getenv("METRICS_HOST", "127.0.0.1"), int(os.getenv("METRICS_PORT")))
+            self.__class__.metrics_server = server
+        try:
+            await asyncio.shield(self.scheduler.start())
+        finally:
+            await self.phases.stop()
+            self.scheduler.unwatch(self.phase1_tracker)
+            self.scheduler.unwatch(self.phase2_tracker)
+            if not self.scheduler.trackers:
+                await self.scheduler.stop()
+            if server:
+                server.close()
+                self.__class__.metrics_server = None
+            
+    async def close(self):
+        """Release the shared WebSocket and HTTP connection pools"""
+        # Other bots in this process may still be using the shared socket
+        await self.phase1_tracker.stop()
+        if not self.phase1_tracker.connection.subscribed:
+            await self.phase1_tracker.connection.stop()
+        await self.phase2_tracker.client.close()
+        await self.http.close()
+        if self.image_processor:
+            self.image_processor.shutdown()
+        self.save_state()
+        self.series.close()
+        self.state.close()  # Checkpoints the WAL so the database is one self-contained file
+        
+    async def run_and_close(self, coro):
+        """Await `coro` and release network resources afterwards"""
+        try:
+            return await coro
+        finally:
+            await self.outbox.drain()
+            await self.outbox.stop()
+            await self.image_pool.wait()
+            await self.tweet_pool.wait()
+            await self.close()
 
     def test_mode(self, test_price_change=None):
         """Test mode to simulate different price movements"""
         try:
             # Get current price and 1h change
             print("\n=== Checking Current Price Data ===")
-            current_price, price_change_1h = asyncio.run(self.current_tracker.get_price() if self.current_tracker else self.phase1_tracker.get_price())
+            current_price, price_change_1h = asyncio.run(self.run_and_close(self.current_tracker.get_price() if self.current_tracker else self.phase1_tracker.get_price()))
             
             if current_price is None:
                 print("=== Failed to fetch price data from all sources ===\n")
@@ -433,8 +2725,8 @@ class MemeBot:
         except Exception as e:
             print(f"Error in test mode: {e}")
 
-    def test_images(self):
-        """Test all mood images without price checks"""
+    def test_images(self, count=None):
+        """Test all mood images without price checks, or prewarm the pool with `count` each"""
         moods = [
             'gigabullish',    # >100% (laser eyes, explosions)
             'bullish',        # 50-100% (floating, victory)
@@ -446,6 +2738,11 @@ class MemeBot:
             'its_over'        # <-100% (melting/shattered)
         ]
         
+        if count:
+            print(f"\n=== Prewarming image pool with {count} image(s) per mood ===")
+            asyncio.run(self.run_and_close(self.image_pool.prewarm(moods, count)))
+            return
+            
         print("\n=== Testing All Mood Images ===")
         for mood in moods:
             print(f"\n=== Generating {mood} image ===")
@@ -453,8 +2750,13 @@ class MemeBot:
             print(f"Image URL: {image_url}")
             print("=" * 50)
 
-    def test_single_mood(self, mood):
-        """Test a single mood image"""
+    def test_single_mood(self, mood, count=None):
+        """Test a single mood image, or prewarm its pool with `count` images"""
+        if count:
+            print(f"\n=== Prewarming {mood} pool with {count} image(s) ===")
+            asyncio.run(self.run_and_close(self.image_pool.prewarm([mood], count)))
+            return
+            
         print(f"\n=== Testing {mood} mood ===")
         image_url = self.generate_image(mood)
         print(f"Image URL: {image_url}")
@@ -462,25 +2764,71 @@ class MemeBot:
 
 if __name__ == "__main__":
     import sys
+    
+    if len(sys.argv) > 1 and sys.argv[1] == "replay":
+        # replay <trades.jsonl | series/<key>> [hysteresis:min_dwell] ...
+        if len(sys.argv) < 3:
+            print("Usage: replay <trades.jsonl|series_dir/key> [hysteresis:min_dwell] ...")
+            sys.exit(1)
+        configs = [tuple(float(x) for x in arg.split(":")) for arg in sys.argv[3:]]
+        configs = configs or [(h, d) for h in (0.0, 2.0, 5.0) for d in (300.0, 600.0, 1800.0)]
+        started = time.perf_counter()
+        try:
+            replay = Replay.load(
+                sys.argv[2],
+                mint=os.getenv("REPLAY_MINT"),
+                window=float(os.getenv("REPLAY_WINDOW", "300")),
+                tick=float(os.getenv("REPLAY_TICK", "1"))
+            )
+        except (OSError, ValueError) as e:
+            print(f"Cannot replay {sys.argv[2]}: {e}")
+            sys.exit(1)
+        per_day = float(os.getenv("TWEETS_PER_DAY", "17"))
+        print(f"Replaying {len(replay.timestamps)} observations over {len(replay.times)} ticks "
+              f"in {time.perf_counter() - started:.2f}s")
+        for hysteresis, min_dwell in configs:
+            started = time.perf_counter()
+            posts, dropped = replay.run(hysteresis, min_dwell, per_day=per_day)
+            kinds = {kind: sum(1 for post in posts if post[1] == kind) for kind in Replay.priorities}
+            print(f"\n=== hysteresis {hysteresis:g} | min dwell {min_dwell:g}s: {len(posts)} posts "
+                  f"({', '.join(f'{k}: {v}' for k, v in kinds.items())}), {dropped} dropped, "
+                  f"{time.perf_counter() - started:.3f}s ===")
+            for timestamp, kind, mood, change in posts:
+                print(f"{datetime.fromtimestamp(timestamp).isoformat(timespec='seconds')}  "
+                      f"{kind:<12} {mood:<13} {change:+.2f}%")
+        sys.exit(0)
+        
+    if len(sys.argv) > 1 and sys.argv[1] == "shard":
+        # shard <workers> <phase1[:phase2]> ...
+        if len(sys.argv) < 4:
+            print("Usage: shard <workers> <phase1_token[:phase2_token]> ...")
+            sys.exit(1)
+        pairs = [tuple(arg.split(":", 1)) if ":" in arg else (arg, arg) for arg in sys.argv[3:]]
+        ShardSupervisor(pairs, int(sys.argv[2])).run()
+        sys.exit(0)
+        
     bot = MemeBot()
     
     if len(sys.argv) > 1:
         if sys.argv[1] == "test1":
             print("Testing Phase 1 (PumpFun)...")
-            asyncio.run(bot.run_phase1())
+            asyncio.run(bot.run_and_close(bot.run_phase1()))
         elif sys.argv[1] == "test2":
             print("Testing Phase 2 (DexScreener)...")
-            asyncio.run(bot.run_phase2_once())
+            asyncio.run(bot.run_and_close(bot.run_phase2_once()))
+        elif sys.argv[1] == "events":
+            print("Running event-driven mode...")
+            asyncio.run(bot.run_and_close(bot.run_events()))
         elif sys.argv[1] == "test":
             bot.test_mode()
         elif sys.argv[1] == "images":
-            bot.test_images()
+            bot.test_images(int(sys.argv[2]) if len(sys.argv) > 2 else None)
         elif sys.argv[1] == "mood":
             if len(sys.argv) > 2:
-                bot.test_single_mood(sys.argv[2])
+                bot.test_single_mood(sys.argv[2], int(sys.argv[3]) if len(sys.argv) > 3 else None)
             else:
                 print("Please specify a mood to test")
         else:
-            print("Invalid argument. Use 'test1', 'test2', 'test', 'images', or 'mood <mood_name>'")
+            print("Invalid argument. Use 'test1', 'test2', 'events', 'shard', 'replay', 'test', 'images [count]', or 'mood <mood_name> [count]'")
     else:
-        asyncio.run(bot.run()) 
\ No newline at end of file
+        asyncio.run(bot.run_and_close(bot.run())) 
\ No newline at end of file